@@ -1,12 +1,18 @@
 """Config management for tile servers, noun phrases, and UI state."""
 
-import json
+import asyncio
+import itertools
 import re
 from pathlib import Path
 from typing import Optional
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
+import orjson
+from fastapi import APIRouter, HTTPException, Request, Response
+from pydantic import BaseModel, ConfigDict, Field
+
+_SEPARATOR_RE = re.compile(r"[\s_]+")
+_INVALID_CHAR_RE = re.compile(r"[^a-z0-9-]")
+_REPEATED_HYPHEN_RE = re.compile(r"-+")
 
 
 def sanitize_name_to_id(name: str) -> str:
@@ -14,11 +20,11 @@ def sanitize_name_to_id(name: str) -> str:
     # Convert to lowercase
     id_str = name.lower()
     # Replace spaces and underscores with hyphens
-    id_str = re.sub(r"[\s_]+", "-", id_str)
+    id_str = _SEPARATOR_RE.sub("-", id_str)
     # Remove non-alphanumeric characters (except hyphens)
-    id_str = re.sub(r"[^a-z0-9-]", "", id_str)
+    id_str = _INVALID_CHAR_RE.sub("", id_str)
     # Collapse multiple hyphens
-    id_str = re.sub(r"-+", "-", id_str)
+    id_str = _REPEATED_HYPHEN_RE.sub("-", id_str)
     # Strip leading/trailing hyphens
     id_str = id_str.strip("-")
     return id_str or "tile-server"
@@ -33,6 +39,8 @@ UI_STATE_FILE = DATA_DIR / "ui_state.json"
 class TileServer(BaseModel):
     """Tile server configuration."""
 
+    model_config = ConfigDict(defer_build=True)
+
     id: str = ""
     name: str
     url_template: str
@@ -45,6 +53,8 @@ class TileServer(BaseModel):
 class Config(BaseModel):
     """Application configuration."""
 
+    model_config = ConfigDict(defer_build=True)
+
     tile_servers: list[TileServer] = Field(default_factory=list)
     labeling_zoom: int = 18
     noun_phrases: list[str] = Field(
@@ -56,6 +66,8 @@ class Config(BaseModel):
 class Viewport(BaseModel):
     """Map viewport state."""
 
+    model_config = ConfigDict(defer_build=True)
+
     latitude: float = 37.75
     longitude: float = -122.4
     zoom: float = 14
@@ -66,6 +78,8 @@ class Viewport(BaseModel):
 class UIState(BaseModel):
     """UI state for persistence."""
 
+    model_config = ConfigDict(defer_build=True)
+
     viewport: Viewport = Field(default_factory=Viewport)
     active_layers: list[str] = Field(default_factory=list)
     selected_tile: Optional[dict] = None
@@ -76,127 +90,198 @@ def ensure_data_dir():
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 
+# Parsed file contents keyed by the file's mtime, so repeated requests skip the
+# JSON parse and model validation until the file actually changes on disk.
+_config_cache: Optional[tuple[int, Config]] = None
+_ui_state_cache: Optional[tuple[int, UIState]] = None
+_servers_index: Optional[tuple[Config, dict[str, TileServer]]] = None
+
+# File I/O runs in worker threads, so read-modify-write endpoints must not
+# interleave while awaiting it.
+_config_lock = asyncio.Lock()
+
+
 def load_config() -> Config:
-    """Load config from file or return default."""
+    """Load config from file or return default.
+
+    The returned object is cached and shared between callers; copy it before
+    mutating.
+    """
+    global _config_cache
     ensure_data_dir()
-    if CONFIG_FILE.exists():
-        try:
-            data = json.loads(CONFIG_FILE.read_text())
-            return Config(**data)
-        except (json.JSONDecodeError, ValueError):
-            return Config()
-    return Config()
+    try:
+        mtime = CONFIG_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return Config()
+    if _config_cache is not None and _config_cache[0] == mtime:
+        return _config_cache[1]
+    try:
+        data = orjson.loads(CONFIG_FILE.read_bytes())
+        config = Config(**data)
+    except (orjson.JSONDecodeError, ValueError):
+        config = Config()
+    _config_cache = (mtime, config)
+    return config
+
+
+def servers_by_id(config: Config) -> dict[str, TileServer]:
+    """Index a config's tile servers by id.
+
+    The index for the cached config is kept until the config changes.
+    """
+    global _servers_index
+    if _servers_index is not None and _servers_index[0] is config:
+        return _servers_index[1]
+    index = {server.id: server for server in config.tile_servers}
+    if _config_cache is not None and _config_cache[1] is config:
+        _servers_index = (config, index)
+    return index
+
+
+def config_etag() -> str:
+    """ETag for the config file, derived from its modification time."""
+    try:
+        return f'"{CONFIG_FILE.stat().st_mtime_ns:x}"'
+    except FileNotFoundError:
+        return '"default"'
 
 
 def save_config(config: Config):
     """Save config to file."""
+    global _config_cache
     ensure_data_dir()
-    CONFIG_FILE.write_text(config.model_dump_json(indent=2))
+    CONFIG_FILE.write_text(config.model_dump_json())
+    _config_cache = (CONFIG_FILE.stat().st_mtime_ns, config)
 
 
 def load_ui_state() -> UIState:
-    """Load UI state from file or return default."""
+    """Load UI state from file or return default.
+
+    The returned object is cached and shared between callers; copy it before
+    mutating.
+    """
+    global _ui_state_cache
     ensure_data_dir()
-    if UI_STATE_FILE.exists():
-        try:
-            data = json.loads(UI_STATE_FILE.read_text())
-            return UIState(**data)
-        except (json.JSONDecodeError, ValueError):
-            return UIState()
-    return UIState()
+    try:
+        mtime = UI_STATE_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return UIState()
+    if _ui_state_cache is not None and _ui_state_cache[0] == mtime:
+        return _ui_state_cache[1]
+    try:
+        data = orjson.loads(UI_STATE_FILE.read_bytes())
+        state = UIState(**data)
+    except (orjson.JSONDecodeError, ValueError):
+        state = UIState()
+    _ui_state_cache = (mtime, state)
+    return state
 
 
 def save_ui_state(state: UIState):
     """Save UI state to file."""
+    global _ui_state_cache
     ensure_data_dir()
-    UI_STATE_FILE.write_text(state.model_dump_json(indent=2))
+    UI_STATE_FILE.write_text(state.model_dump_json())
+    _ui_state_cache = (UI_STATE_FILE.stat().st_mtime_ns, state)
 
 
 # --- API Endpoints ---
 
 
 @router.get("", response_model=Config)
-async def get_config():
+async def get_config(request: Request, response: Response):
     """Get current configuration."""
-    return load_config()
+    etag = config_etag()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return await asyncio.to_thread(load_config)
 
 
 @router.put("", response_model=Config)
 async def update_config(config: Config):
     """Update entire configuration."""
-    save_config(config)
+    async with _config_lock:
+        await asyncio.to_thread(save_config, config)
     return config
 
 
 @router.post("/tile-servers", response_model=TileServer)
 async def add_tile_server(server: TileServer):
     """Add a new tile server."""
-    config = load_config()
-    if not server.id:
-        # Generate ID from sanitized name
-        base_id = sanitize_name_to_id(server.name)
-        server.id = base_id
-        # Ensure uniqueness by adding suffix if needed
-        existing_ids = {s.id for s in config.tile_servers}
-        counter = 1
-        while server.id in existing_ids:
-            server.id = f"{base_id}-{counter}"
-            counter += 1
-    config.tile_servers.append(server)
-    save_config(config)
-    return server
+    async with _config_lock:
+        config = (await asyncio.to_thread(load_config)).model_copy(deep=True)
+        if not server.id:
+            # Generate ID from sanitized name
+            base_id = sanitize_name_to_id(server.name)
+            # Ensure uniqueness by adding suffix if needed
+            existing_ids = {s.id for s in config.tile_servers}
+            candidate = base_id
+            suffixes = itertools.count(1)
+            while candidate in existing_ids:
+                candidate = f"{base_id}-{next(suffixes)}"
+            server.id = candidate
+        config.tile_servers.append(server)
+        await asyncio.to_thread(save_config, config)
+        return server
 
 
 @router.put("/tile-servers/{server_id}", response_model=TileServer)
 async def update_tile_server(server_id: str, server: TileServer):
     """Update an existing tile server."""
-    config = load_config()
-    for i, s in enumerate(config.tile_servers):
-        if s.id == server_id:
-            server.id = server_id
-            config.tile_servers[i] = server
-            save_config(config)
-            return server
-    raise HTTPException(status_code=404, detail="Tile server not found")
+    async with _config_lock:
+        config = (await asyncio.to_thread(load_config)).model_copy(deep=True)
+        for i, s in enumerate(config.tile_servers):
+            if s.id == server_id:
+                server.id = server_id
+                config.tile_servers[i] = server
+                await asyncio.to_thread(save_config, config)
+                return server
+        raise HTTPException(status_code=404, detail="Tile server not found")
 
 
 @router.delete("/tile-servers/{server_id}")
 async def delete_tile_server(server_id: str):
     """Delete a tile server."""
-    config = load_config()
-    original_len = len(config.tile_servers)
-    config.tile_servers = [s for s in config.tile_servers if s.id != server_id]
-    if len(config.tile_servers) == original_len:
-        raise HTTPException(status_code=404, detail="Tile server not found")
-    save_config(config)
-    return {"deleted": server_id}
+    async with _config_lock:
+        config = (await asyncio.to_thread(load_config)).model_copy(deep=True)
+        original_len = len(config.tile_servers)
+        config.tile_servers = [s for s in config.tile_servers if s.id != server_id]
+        if len(config.tile_servers) == original_len:
+            raise HTTPException(status_code=404, detail="Tile server not found")
+        await asyncio.to_thread(save_config, config)
+        return {"deleted": server_id}
 
 
 @router.put("/noun-phrases", response_model=list[str])
 async def update_noun_phrases(phrases: list[str]):
     """Update noun phrases list."""
-    config = load_config()
-    config.noun_phrases = phrases
-    save_config(config)
-    return phrases
+    async with _config_lock:
+        config = (await asyncio.to_thread(load_config)).model_copy(deep=True)
+        config.noun_phrases = phrases
+        await asyncio.to_thread(save_config, config)
+        return phrases
 
 
 @router.put("/labeling-zoom", response_model=int)
 async def update_labeling_zoom(zoom: int):
     """Update labeling zoom level."""
-    config = load_config()
-    config.labeling_zoom = zoom
-    save_config(config)
-    return zoom
+    async with _config_lock:
+        config = (await asyncio.to_thread(load_config)).model_copy(deep=True)
+        config.labeling_zoom = zoom
+        await asyncio.to_thread(save_config, config)
+        return zoom
 
 
 @router.put("/labeling-extent")
 async def update_labeling_extent(extent: Optional[list[float]]):
     """Update labeling extent."""
-    config = load_config()
-    config.labeling_extent = extent
-    save_config(config)
-    return extent
+    async with _config_lock:
+        config = (await asyncio.to_thread(load_config)).model_copy(deep=True)
+        config.labeling_extent = extent
+        await asyncio.to_thread(save_config, config)
+        return extent
 
 
 # --- UI State Endpoints ---
@@ -205,12 +290,12 @@ async def update_labeling_extent(extent: Optional[list[float]]):
 @router.get("/ui-state", response_model=UIState)
 async def get_ui_state():
     """Get current UI state."""
-    return load_ui_state()
+    return await asyncio.to_thread(load_ui_state)
 
 
 @router.put("/ui-state", response_model=UIState)
 async def update_ui_state(state: UIState):
     """Update UI state."""
-    save_ui_state(state)
+    await asyncio.to_thread(save_ui_state, state)
     return state
 
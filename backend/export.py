@@ -1,22 +1,27 @@
 """Export functionality for labels and tiles."""
 
 import asyncio
-import json
+import platform
+import subprocess
+import tempfile
+from itertools import chain
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
 
-import geopandas as gpd
-import pandas as pd
-from fastapi import APIRouter, HTTPException, Query
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse
-from morecantile import Tile
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from sse_starlette.sse import EventSourceResponse
-from shapely.geometry import box
 
-from config import load_config
-from labels import load_labels
-from tile_downloader import download_tiles_with_progress, get_tiles_in_bbox, tile_to_bounds
+from config import load_config, servers_by_id
+from labels import labels_version, load_labels
+
+# pandas/numpy/shapely and the tile downloader (morecantile) are imported in
+# the endpoints that need them to keep server startup light.
+if TYPE_CHECKING:
+    import aiohttp
+    from morecantile import Tile
 
 router = APIRouter()
 
@@ -24,11 +29,30 @@ DATA_DIR = Path(__file__).parent.parent / "data"
 TILES_DIR = DATA_DIR / "tiles"
 GEOJSON_FILE = DATA_DIR / "labels.geojson"
 COCO_FILE = DATA_DIR / "annotations.json"
+# Kept apart from labels.LEGACY_LABELS_FILE, which a new database imports
+GEOPARQUET_FILE = DATA_DIR / "labels_export.geoparquet"
+
+# System file manager command, resolved once at import
+OPEN_DIR_COMMAND = {
+    "Darwin": ["open"],  # macOS
+    "Windows": ["explorer"],
+}.get(platform.system(), ["xdg-open"])  # Linux
+
+# Size of the chunks sent to the client (and written to disk) for JSON exports
+STREAM_CHUNK_SIZE = 64 * 1024
+# Rows per GeoParquet row group; small enough for tile filters to skip groups
+PARQUET_ROW_GROUP_SIZE = 10_000
+# Connection pool size of the HTTP session shared by all tile downloads
+HTTP_MAX_CONNECTIONS = 100
+
+_http_session: Optional["aiohttp.ClientSession"] = None
 
 
 class ExportRequest(BaseModel):
     """Request for tile image download."""
 
+    model_config = ConfigDict(defer_build=True)
+
     tile_server_id: str
     include_unlabeled: bool = False
 
@@ -36,7 +60,77 @@ class ExportRequest(BaseModel):
 class DownloadRequest(BaseModel):
     """Request for downloading all tiles in labeling extent."""
 
+    model_config = ConfigDict(defer_build=True)
+
     tile_server_id: str
+    revalidate: bool = False
+
+
+def get_http_session() -> "aiohttp.ClientSession":
+    """Return the HTTP session shared by tile downloads, creating it if needed.
+
+    Keeping one session alive lets consecutive downloads from the same tile
+    server reuse open connections instead of reconnecting for every tile.
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        from tile_downloader import create_session
+
+        _http_session = create_session(HTTP_MAX_CONNECTIONS)
+    return _http_session
+
+
+async def close_http_session():
+    """Close the shared HTTP session, if one was opened."""
+    global _http_session
+    if _http_session is not None:
+        await _http_session.close()
+        _http_session = None
+
+
+# --- Streaming JSON ---
+
+
+def encode_json_array(items: Iterable) -> Iterator[bytes]:
+    """Encode an iterable as a JSON array, one item at a time."""
+    yield b"["
+    for i, item in enumerate(items):
+        if i:
+            yield b","
+        yield orjson.dumps(item, option=orjson.OPT_SERIALIZE_NUMPY)
+    yield b"]"
+
+
+def stream_to_file(fragments: Iterable[bytes], path: Path) -> Iterator[bytes]:
+    """Re-chunk encoded JSON fragments, writing each chunk to `path` as it is yielded.
+
+    The file is written under a temporary name and moved into place once the
+    whole document has been produced, so an aborted request leaves the
+    previous export intact.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # A unique name per export, so overlapping requests don't clobber each other
+    f = tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False
+    )
+    tmp_path = Path(f.name)
+    buffer = bytearray()
+    try:
+        with f:
+            for fragment in fragments:
+                buffer += fragment
+                if len(buffer) >= STREAM_CHUNK_SIZE:
+                    chunk = bytes(buffer)
+                    buffer.clear()
+                    f.write(chunk)
+                    yield chunk
+            chunk = bytes(buffer)
+            f.write(chunk)
+        tmp_path.replace(path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    yield chunk
 
 
 # --- GeoJSON Export ---
@@ -44,12 +138,21 @@ class DownloadRequest(BaseModel):
 
 @router.get("/geojson")
 async def export_geojson(
+    request: Request,
     use_geo_bbox: bool = Query(True, description="Use geographic bbox coordinates instead of pixel-relative coordinates"),
     tile_size: Optional[int] = Query(None, description="Tile size in pixels (defaults to 256 if not provided)"),
 ):
     """Export labels as GeoJSON with tile indices."""
-    gdf = load_labels()
-    config = load_config()
+    import pandas as pd
+    from shapely.geometry import box
+
+    # Unchanged labels produce the same export, which is already on disk
+    etag = f'"{await asyncio.to_thread(labels_version)}-{int(use_geo_bbox)}"'
+    if request.headers.get("if-none-match") == etag and GEOJSON_FILE.exists():
+        return Response(status_code=304, headers={"ETag": etag})
+
+    gdf = await asyncio.to_thread(load_labels)
+    config = await asyncio.to_thread(load_config)
 
     # Get tile size from config or use default
     if tile_size is None:
@@ -58,65 +161,78 @@ async def export_geojson(
         if config.tile_servers:
             tile_size = config.tile_servers[0].tile_size
 
-    if len(gdf) == 0:
-        geojson_data = {
-            "type": "FeatureCollection",
-            "features": [],
-        }
+    # Determine geometry based on use_geo_bbox flag
+    if use_geo_bbox:
+        # Use geo_bounds directly - this is the geographic bbox of the drawn bbox
+        # geo_bounds is [west, south, east, north] in geographic coordinates
+        geometries = [box(*bounds).__geo_interface__ for bounds in gdf["geo_bounds"]]
     else:
-        # Add tile info to properties
-        features = []
-        for _, row in gdf.iterrows():
-            # Convert pixel_bbox to list if it's a numpy array or other type
-            pixel_bbox = row["pixel_bbox"]
-            if hasattr(pixel_bbox, 'tolist'):
-                pixel_bbox = pixel_bbox.tolist()
-            elif not isinstance(pixel_bbox, list):
-                pixel_bbox = list(pixel_bbox)
-            
-            # Determine geometry based on use_geo_bbox flag
-            if use_geo_bbox:
-                # Use geo_bounds directly - this is the geographic bbox of the drawn bbox
-                # geo_bounds is [west, south, east, north] in geographic coordinates
-                geo_bounds = row["geo_bounds"]
-                if hasattr(geo_bounds, 'tolist'):
-                    geo_bounds = geo_bounds.tolist()
-                elif not isinstance(geo_bounds, list):
-                    geo_bounds = list(geo_bounds)
-                
-                # Create bbox geometry from geo_bounds
-                geo_bbox = box(*geo_bounds)
-                geometry = geo_bbox.__geo_interface__
-            else:
-                # Use existing geometry (which is already geographic from geo_bounds)
-                geometry = row["geometry"].__geo_interface__
-            
-            feature = {
-                "type": "Feature",
-                "geometry": geometry,
-                "properties": {
-                    "id": str(row["id"]),
-                    "tile_x": int(row["tile_x"]),
-                    "tile_y": int(row["tile_y"]),
-                    "tile_z": int(row["tile_z"]),
-                    "pixel_bbox": pixel_bbox,
-                    "noun_phrase": str(row["noun_phrase"]) if pd.notna(row["noun_phrase"]) and row["noun_phrase"] else None,
-                    "is_negative": bool(row["is_negative"]),
-                    "created_at": row["created_at"].isoformat(),
-                },
-            }
-            features.append(feature)
-
-        geojson_data = {
-            "type": "FeatureCollection",
-            "features": features,
+        # Use existing geometry (which is already geographic from geo_bounds)
+        geometries = [geom.__geo_interface__ for geom in gdf.geometry]
+
+    # Add tile info to properties, reading whole columns instead of per-row Series
+    features = (
+        {
+            "type": "Feature",
+            "geometry": geometry,
+            "properties": {
+                "id": label_id,
+                "tile_x": tile_x,
+                "tile_y": tile_y,
+                "tile_z": tile_z,
+                "pixel_bbox": pixel_bbox,
+                "noun_phrase": noun_phrase if pd.notna(noun_phrase) and noun_phrase else None,
+                "is_negative": is_negative,
+                "created_at": created_at.isoformat(),
+            },
         }
+        for geometry, label_id, tile_x, tile_y, tile_z, pixel_bbox, noun_phrase, is_negative, created_at in zip(
+            geometries,
+            gdf["id"].tolist(),
+            gdf["tile_x"].tolist(),
+            gdf["tile_y"].tolist(),
+            gdf["tile_z"].tolist(),
+            gdf["pixel_bbox"].tolist(),
+            gdf["noun_phrase"].tolist(),
+            gdf["is_negative"].tolist(),
+            gdf["created_at"].tolist(),
+        )
+    )
+
+    return StreamingResponse(
+        stream_to_file(
+            chain(
+                [b'{"type":"FeatureCollection","features":'],
+                encode_json_array(features),
+                [b"}"],
+            ),
+            GEOJSON_FILE,
+        ),
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+
+# --- GeoParquet Export ---
+
+
+@router.get("/geoparquet")
+async def export_geoparquet():
+    """Export labels as GeoParquet.
+
+    Rows are sorted by tile so row-group statistics let readers push down
+    filters such as `filters=[("tile_z", "=", z), ("tile_x", "=", x), ...]`.
+    """
+    gdf = await asyncio.to_thread(load_labels)
+    gdf = gdf.sort_values(["tile_z", "tile_x", "tile_y"], ignore_index=True)
 
     # Persist to disk
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    GEOJSON_FILE.write_text(json.dumps(geojson_data, indent=2))
+    await asyncio.to_thread(
+        gdf.to_parquet, GEOPARQUET_FILE, row_group_size=PARQUET_ROW_GROUP_SIZE
+    )
 
-    return geojson_data
+    return {"path": str(GEOPARQUET_FILE.resolve()), "count": len(gdf)}
 
 
 # --- COCO Export ---
@@ -127,88 +243,86 @@ async def export_coco(
     tile_server_id: Optional[str] = Query(None, description="Tile server to use for image paths"),
 ):
     """Export labels as COCO-format JSON."""
-    gdf = load_labels()
-    config = load_config()
+    import numpy as np
+    import pandas as pd
+
+    gdf = await asyncio.to_thread(load_labels)
+    config = await asyncio.to_thread(load_config)
 
     # Find tile server for tile size
     tile_size = 256
-    if tile_server_id:
-        for server in config.tile_servers:
-            if server.id == tile_server_id:
-                tile_size = server.tile_size
-                break
-
-    images = []
-    annotations = []
-    image_id_map = {}  # (z, x, y) -> image_id
-    annotation_id = 1
+    server = servers_by_id(config).get(tile_server_id)
+    if server is not None:
+        tile_size = server.tile_size
 
     # Get unique tiles
-    if len(gdf) > 0:
-        unique_tiles = gdf[["tile_z", "tile_x", "tile_y"]].drop_duplicates()
-
-        for i, (_, tile_row) in enumerate(unique_tiles.iterrows(), start=1):
-            z, x, y = int(tile_row["tile_z"]), int(tile_row["tile_x"]), int(tile_row["tile_y"])
-            image_id_map[(z, x, y)] = i
-
-            images.append({
-                "id": i,
-                "file_name": f"tiles/{z}_{x}_{y}.png",
-                "width": tile_size,
-                "height": tile_size,
-            })
-
-        # Create annotations
-        for _, row in gdf.iterrows():
-            if row["is_negative"]:
-                continue  # Skip negative examples for annotations
-
-            z, x, y = int(row["tile_z"]), int(row["tile_x"]), int(row["tile_y"])
-            image_id = image_id_map[(z, x, y)]
-            
-            # Convert pixel_bbox to list if it's a numpy array or other type
-            pixel_bbox = row["pixel_bbox"]
-            if hasattr(pixel_bbox, 'tolist'):
-                pixel_bbox = pixel_bbox.tolist()
-            elif not isinstance(pixel_bbox, list):
-                pixel_bbox = list(pixel_bbox)
-            
-            # Ensure all values in pixel_bbox are Python native types
-            pixel_bbox = [float(x) for x in pixel_bbox]
-
-            # Create segmentation polygon from bbox
-            bx, by, bw, bh = pixel_bbox
-            segmentation = [[
-                bx, by,
-                bx + bw, by,
-                bx + bw, by + bh,
-                bx, by + bh,
-            ]]
-
-            annotations.append({
-                "id": annotation_id,
-                "image_id": image_id,
-                "category_id": 1,
-                "bbox": pixel_bbox,
-                "segmentation": segmentation,
-                "area": float(bw * bh),
-                "iscrowd": 0,
-                "noun_phrase": str(row["noun_phrase"]) if pd.notna(row["noun_phrase"]) and row["noun_phrase"] else "",
-            })
-            annotation_id += 1
-
-    coco_data = {
-        "info": {"description": "Tile labeling dataset"},
-        "images": images,
-        "annotations": annotations,
-        "categories": [{"id": 1, "name": "object"}],
-    }
-
-    # Persist to disk
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    COCO_FILE.write_text(json.dumps(coco_data, indent=2))
+    unique_tiles = gdf[["tile_z", "tile_x", "tile_y"]].drop_duplicates().to_numpy().tolist()
+    image_id_map = {(z, x, y): i for i, (z, x, y) in enumerate(unique_tiles, start=1)}
+    images = (
+        {
+            "id": i,
+            "file_name": f"tiles/{z}_{x}_{y}.png",
+            "width": tile_size,
+            "height": tile_size,
+        }
+        for i, (z, x, y) in enumerate(unique_tiles, start=1)
+    )
+
+    # Skip negative examples for annotations
+    positives = gdf[~gdf["is_negative"].to_numpy()]
+
+    # Areas and segmentation polygons for all bboxes at once
+    bboxes = np.array(positives["pixel_bbox"].tolist(), dtype=np.float64).reshape(-1, 4)
+    bx, by, bw, bh = bboxes.T
+    segmentations = np.stack(
+        [bx, by, bx + bw, by, bx + bw, by + bh, bx, by + bh], axis=1
+    ).reshape(-1, 1, 8)
+    image_ids = [
+        image_id_map[key]
+        for key in zip(
+            positives["tile_z"].tolist(),
+            positives["tile_x"].tolist(),
+            positives["tile_y"].tolist(),
+        )
+    ]
 
-    return coco_data
+    annotations = (
+        {
+            "id": annotation_id,
+            "image_id": image_id,
+            "category_id": 1,
+            "bbox": bbox,
+            "segmentation": segmentation,
+            "area": area,
+            "iscrowd": 0,
+            "noun_phrase": noun_phrase if pd.notna(noun_phrase) and noun_phrase else "",
+        }
+        for annotation_id, (image_id, bbox, segmentation, area, noun_phrase) in enumerate(
+            zip(
+                image_ids,
+                bboxes.tolist(),
+                segmentations.tolist(),
+                (bw * bh).tolist(),
+                positives["noun_phrase"].tolist(),
+            ),
+            start=1,
+        )
+    )
+
+    return StreamingResponse(
+        stream_to_file(
+            chain(
+                [b'{"info":', orjson.dumps({"description": "Tile labeling dataset"})],
+                [b',"images":'],
+                encode_json_array(images),
+                [b',"annotations":'],
+                encode_json_array(annotations),
+                [b',"categories":', orjson.dumps([{"id": 1, "name": "object"}]), b"}"],
+            ),
+            COCO_FILE,
+        ),
+        media_type="application/json",
+    )
 
 
 # --- Tile Download ---
@@ -217,14 +331,12 @@ async def export_coco(
 @router.post("/download-tiles")
 async def download_tiles(request: DownloadRequest):
     """Download tiles for the labeling extent with SSE progress."""
-    config = load_config()
+    from tile_downloader import download_tiles_with_progress, get_tiles_in_bbox
+
+    config = await asyncio.to_thread(load_config)
 
     # Find the tile server
-    tile_server = None
-    for server in config.tile_servers:
-        if server.id == request.tile_server_id:
-            tile_server = server
-            break
+    tile_server = servers_by_id(config).get(request.tile_server_id)
 
     if tile_server is None:
         raise HTTPException(status_code=404, detail="Tile server not found")
@@ -245,29 +357,33 @@ async def download_tiles(request: DownloadRequest):
             output_dir=output_dir,
             max_concurrent=50,
             skip_existing=True,
+            session=get_http_session(),
+            revalidate=request.revalidate,
         ):
             yield {
                 "event": "progress",
-                "data": json.dumps({
+                "data": orjson.dumps({
                     "total": progress.total,
                     "completed": progress.completed,
                     "failed": progress.failed,
                     "skipped": progress.skipped,
                     "current_tile": progress.current_tile,
                     "error": progress.error,
-                }),
+                }).decode(),
             }
 
         yield {
             "event": "complete",
-            "data": json.dumps({"status": "done"}),
+            "data": orjson.dumps({"status": "done"}).decode(),
         }
 
     return EventSourceResponse(generate_events())
 
 
-def get_surrounding_tiles(tile: Tile) -> list[Tile]:
+def get_surrounding_tiles(tile: "Tile") -> list["Tile"]:
     """Get 3x3 grid of tiles centered on the given tile."""
+    from morecantile import Tile
+
     tiles = []
     for dx in [-1, 0, 1]:
         for dy in [-1, 0, 1]:
@@ -279,17 +395,18 @@ def get_surrounding_tiles(tile: Tile) -> list[Tile]:
 async def download_labeled_tiles(
     tile_server_id: str,
     include_surrounding: bool = Query(False, description="Include surrounding tiles (3x3 grid) for sliding window"),
+    revalidate: bool = Query(False, description="Re-check existing tiles with the server (conditional GET)"),
 ):
     """Download only tiles that have labels with SSE progress."""
-    config = load_config()
-    gdf = load_labels()
+    from morecantile import Tile
+
+    from tile_downloader import download_tiles_with_progress
+
+    config = await asyncio.to_thread(load_config)
+    gdf = await asyncio.to_thread(load_labels)
 
     # Find the tile server
-    tile_server = None
-    for server in config.tile_servers:
-        if server.id == tile_server_id:
-            tile_server = server
-            break
+    tile_server = servers_by_id(config).get(tile_server_id)
 
     if tile_server is None:
         raise HTTPException(status_code=404, detail="Tile server not found")
@@ -298,15 +415,14 @@ async def download_labeled_tiles(
         async def empty_events():
             yield {
                 "event": "complete",
-                "data": json.dumps({"status": "done", "message": "No labels to download"}),
+                "data": orjson.dumps({"status": "done", "message": "No labels to download"}).decode(),
             }
         return EventSourceResponse(empty_events())
 
     # Get unique labeled tiles
     unique_tiles = gdf[["tile_z", "tile_x", "tile_y"]].drop_duplicates()
     labeled_tiles = [
-        Tile(x=int(row["tile_x"]), y=int(row["tile_y"]), z=int(row["tile_z"]))
-        for _, row in unique_tiles.iterrows()
+        Tile(x=x, y=y, z=z) for z, x, y in unique_tiles.itertuples(index=False)
     ]
 
     # Optionally include surrounding tiles for sliding window
@@ -328,22 +444,24 @@ async def download_labeled_tiles(
             output_dir=output_dir,
             max_concurrent=50,
             skip_existing=True,
+            session=get_http_session(),
+            revalidate=revalidate,
         ):
             yield {
                 "event": "progress",
-                "data": json.dumps({
+                "data": orjson.dumps({
                     "total": progress.total,
                     "completed": progress.completed,
                     "failed": progress.failed,
                     "skipped": progress.skipped,
                     "current_tile": progress.current_tile,
                     "error": progress.error,
-                }),
+                }).decode(),
             }
 
         yield {
             "event": "complete",
-            "data": json.dumps({"status": "done"}),
+            "data": orjson.dumps({"status": "done"}).decode(),
         }
 
     return EventSourceResponse(generate_events())
@@ -361,20 +479,10 @@ async def get_data_dir():
 @router.post("/open-data-dir")
 async def open_data_dir():
     """Open the data directory in the system file manager."""
-    import platform
-    import subprocess
-    
     path = str(DATA_DIR.resolve())
-    system = platform.system()
-    
+
     try:
-        if system == "Darwin":  # macOS
-            subprocess.run(["open", path])
-        elif system == "Windows":
-            subprocess.run(["explorer", path])
-        else:  # Linux
-            subprocess.run(["xdg-open", path])
+        subprocess.run([*OPEN_DIR_COMMAND, path], check=False, stdin=subprocess.DEVNULL)
         return {"status": "opened"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to open directory: {str(e)}")
-
@@ -1,20 +1,78 @@
-"""Labels management with GeoParquet persistence."""
+"""Labels management with SQLite persistence."""
 
+import asyncio
+import sqlite3
+import threading
 import uuid
+from contextlib import closing
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-import geopandas as gpd
-import pandas as pd
-from fastapi import APIRouter, HTTPException
+import orjson
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel, Field
-from shapely.geometry import box
+
+# geopandas is only needed for GeoParquet import and exports, so it is imported
+# lazily to keep server startup light.
+if TYPE_CHECKING:
+    import geopandas as gpd
 
 router = APIRouter()
 
 DATA_DIR = Path(__file__).parent.parent / "data"
-LABELS_FILE = DATA_DIR / "labels.geoparquet"
+LABELS_DB = DATA_DIR / "labels.db"
+# Where labels were kept before the SQLite database. A new database imports
+# it on first connect, then renames it so it is only ever imported once.
+LEGACY_LABELS_FILE = DATA_DIR / "labels.geoparquet"
+
+LABEL_COLUMNS = (
+    "id",
+    "tile_x",
+    "tile_y",
+    "tile_z",
+    "pixel_bbox",
+    "noun_phrase",
+    "is_negative",
+    "geo_bounds",
+    "created_at",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    id TEXT PRIMARY KEY,
+    tile_x INTEGER NOT NULL,
+    tile_y INTEGER NOT NULL,
+    tile_z INTEGER NOT NULL,
+    pixel_bbox TEXT NOT NULL,
+    noun_phrase TEXT,
+    is_negative INTEGER NOT NULL,
+    geo_bounds TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS labels_by_tile ON labels (tile_z, tile_x, tile_y);
+
+-- Bumped on every change so clients can revalidate with an ETag
+CREATE TABLE IF NOT EXISTS labels_version (db_id TEXT NOT NULL, version INTEGER NOT NULL);
+INSERT INTO labels_version
+    SELECT lower(hex(randomblob(8))), 0
+    WHERE NOT EXISTS (SELECT 1 FROM labels_version);
+CREATE TRIGGER IF NOT EXISTS labels_inserted AFTER INSERT ON labels
+    BEGIN UPDATE labels_version SET version = version + 1; END;
+CREATE TRIGGER IF NOT EXISTS labels_updated AFTER UPDATE ON labels
+    BEGIN UPDATE labels_version SET version = version + 1; END;
+CREATE TRIGGER IF NOT EXISTS labels_deleted AFTER DELETE ON labels
+    BEGIN UPDATE labels_version SET version = version + 1; END;
+"""
+
+_SELECT = f"SELECT {', '.join(LABEL_COLUMNS)} FROM labels"
+_INSERT = (
+    f"INSERT INTO labels ({', '.join(LABEL_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(LABEL_COLUMNS))})"
+)
+
+_db_lock = threading.Lock()
+_db_initialized = False
 
 
 class LabelCreate(BaseModel):
@@ -58,191 +116,254 @@ def ensure_data_dir():
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def load_labels() -> gpd.GeoDataFrame:
-    """Load labels from GeoParquet or return empty GeoDataFrame."""
+def connect() -> sqlite3.Connection:
+    """Open the labels database, creating the schema on first use.
+
+    A new database is seeded from the GeoParquet file earlier versions saved
+    labels to, which is then renamed to "*.imported" so deleting the
+    database later doesn't bring those labels back.
+    """
+    global _db_initialized
     ensure_data_dir()
-    if LABELS_FILE.exists():
-        try:
-            return gpd.read_parquet(LABELS_FILE)
-        except Exception:
-            pass
-    # Return empty GeoDataFrame with correct schema
+    with _db_lock:
+        is_new = not LABELS_DB.exists()
+        conn = sqlite3.connect(LABELS_DB)
+        if is_new or not _db_initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            if is_new and LEGACY_LABELS_FILE.exists():
+                with conn:
+                    conn.executemany(
+                        _INSERT, _rows_from_geoparquet(LEGACY_LABELS_FILE)
+                    )
+                LEGACY_LABELS_FILE.replace(
+                    LEGACY_LABELS_FILE.with_name(LEGACY_LABELS_FILE.name + ".imported")
+                )
+            _db_initialized = True
+    return conn
+
+
+def _rows_from_geoparquet(path: Path) -> list[tuple]:
+    """Read label rows from a GeoParquet file in database column order."""
+    import geopandas as gpd
+    import pandas as pd
+
+    gdf = gpd.read_parquet(path)
+    return [
+        (
+            str(label_id),
+            tile_x,
+            tile_y,
+            tile_z,
+            orjson.dumps([float(v) for v in pixel_bbox]).decode(),
+            noun_phrase if pd.notna(noun_phrase) else None,
+            int(is_negative),
+            orjson.dumps([float(v) for v in geo_bounds]).decode(),
+            created_at.isoformat(),
+        )
+        for label_id, tile_x, tile_y, tile_z, pixel_bbox, noun_phrase, is_negative, geo_bounds, created_at in zip(
+            *(gdf[column].tolist() for column in LABEL_COLUMNS)
+        )
+    ]
+
+
+def row_to_dict(row: tuple) -> dict:
+    """Convert a database row to a JSON-ready label dict."""
+    label = dict(zip(LABEL_COLUMNS, row))
+    label["pixel_bbox"] = orjson.loads(label["pixel_bbox"])
+    label["is_negative"] = bool(label["is_negative"])
+    label["geo_bounds"] = orjson.loads(label["geo_bounds"])
+    # Stored via isoformat(); match pydantic, which writes UTC as "Z"
+    if label["created_at"].endswith("+00:00"):
+        label["created_at"] = label["created_at"][:-6] + "Z"
+    return label
+
+
+def row_to_label(row: tuple) -> Label:
+    """Convert a database row to a Label model.
+
+    Rows were validated when they were written, so validation is skipped.
+    """
+    label = row_to_dict(row)
+    label["created_at"] = datetime.fromisoformat(label["created_at"])
+    return Label.model_construct(**label)
+
+
+def labels_version() -> str:
+    """Token that changes whenever a label is created, updated or deleted."""
+    with closing(connect()) as conn:
+        db_id, version = conn.execute("SELECT db_id, version FROM labels_version").fetchone()
+    return f"{db_id}-{version}"
+
+
+def fetch_rows(where: str = "", params: tuple = ()) -> list[tuple]:
+    """Select raw label rows matching an optional SQL WHERE clause."""
+    with closing(connect()) as conn:
+        return conn.execute(f"{_SELECT} {where} ORDER BY rowid", params).fetchall()
+
+
+def query_labels_json(where: str = "", params: tuple = ()) -> bytes:
+    """Select labels as an encoded JSON array, without building models."""
+    return orjson.dumps([row_to_dict(row) for row in fetch_rows(where, params)])
+
+
+def load_labels() -> "gpd.GeoDataFrame":
+    """Load all labels into a GeoDataFrame."""
+    import geopandas as gpd
+    import pandas as pd
+    from shapely.geometry import box
+
+    rows = fetch_rows()
+    columns = list(zip(*rows)) if rows else [()] * len(LABEL_COLUMNS)
+    (
+        ids,
+        tile_x,
+        tile_y,
+        tile_z,
+        pixel_bbox,
+        noun_phrase,
+        is_negative,
+        geo_bounds,
+        created_at,
+    ) = columns
+    geo_bounds = [orjson.loads(bounds) for bounds in geo_bounds]
     return gpd.GeoDataFrame(
         {
-            "id": pd.Series(dtype="str"),
-            "tile_x": pd.Series(dtype="int64"),
-            "tile_y": pd.Series(dtype="int64"),
-            "tile_z": pd.Series(dtype="int64"),
-            "pixel_bbox": pd.Series(dtype="object"),
-            "noun_phrase": pd.Series(dtype="str"),
-            "is_negative": pd.Series(dtype="bool"),
-            "geo_bounds": pd.Series(dtype="object"),
-            "created_at": pd.Series(dtype="datetime64[ns, UTC]"),
+            "id": pd.Series(ids, dtype="str"),
+            "tile_x": pd.Series(tile_x, dtype="int64"),
+            "tile_y": pd.Series(tile_y, dtype="int64"),
+            "tile_z": pd.Series(tile_z, dtype="int64"),
+            "pixel_bbox": pd.Series([orjson.loads(bbox) for bbox in pixel_bbox], dtype="object"),
+            "noun_phrase": pd.Series(noun_phrase, dtype="object"),
+            "is_negative": pd.Series(is_negative, dtype="bool"),
+            "geo_bounds": pd.Series(geo_bounds, dtype="object"),
+            "created_at": pd.Series(
+                pd.to_datetime(list(created_at), utc=True, format="ISO8601")
+            ),
         },
-        geometry=gpd.GeoSeries([], crs="EPSG:4326"),
+        geometry=gpd.GeoSeries([box(*bounds) for bounds in geo_bounds], crs="EPSG:4326"),
     )
 
 
-def save_labels(gdf: gpd.GeoDataFrame):
-    """Save labels to GeoParquet."""
-    ensure_data_dir()
-    if len(gdf) == 0:
-        # Delete file if empty
-        if LABELS_FILE.exists():
-            LABELS_FILE.unlink()
-        return
-    gdf.to_parquet(LABELS_FILE)
-
-
-def gdf_to_labels(gdf: gpd.GeoDataFrame) -> list[Label]:
-    """Convert GeoDataFrame to list of Label models."""
-    labels = []
-    for _, row in gdf.iterrows():
-        labels.append(
-            Label(
-                id=row["id"],
-                tile_x=int(row["tile_x"]),
-                tile_y=int(row["tile_y"]),
-                tile_z=int(row["tile_z"]),
-                pixel_bbox=row["pixel_bbox"],
-                noun_phrase=row["noun_phrase"] if pd.notna(row["noun_phrase"]) else None,
-                is_negative=bool(row["is_negative"]),
-                geo_bounds=row["geo_bounds"],
-                created_at=row["created_at"],
-            )
-        )
-    return labels
+def label_to_row(label: Label) -> tuple:
+    """Convert a Label model to a database row."""
+    return (
+        label.id,
+        label.tile_x,
+        label.tile_y,
+        label.tile_z,
+        orjson.dumps(label.pixel_bbox).decode(),
+        label.noun_phrase,
+        int(label.is_negative),
+        orjson.dumps(label.geo_bounds).decode(),
+        label.created_at.isoformat(),
+    )
+
+
+def insert_labels(labels: list[LabelCreate]) -> list[Label]:
+    """Insert new labels in a single transaction and return them."""
+    now = datetime.now(timezone.utc)
+    new_labels = [
+        Label(id=str(uuid.uuid4()), created_at=now, **label.model_dump())
+        for label in labels
+    ]
+    with closing(connect()) as conn, conn:
+        conn.executemany(_INSERT, [label_to_row(label) for label in new_labels])
+    return new_labels
+
+
+def apply_label_update(label_id: str, update: LabelUpdate) -> Optional[Label]:
+    """Apply a partial update to a label, returning None if it doesn't exist."""
+    assignments = {}
+    if update.pixel_bbox is not None:
+        assignments["pixel_bbox"] = orjson.dumps(update.pixel_bbox).decode()
+    if update.noun_phrase is not None:
+        assignments["noun_phrase"] = update.noun_phrase
+    if update.is_negative is not None:
+        assignments["is_negative"] = int(update.is_negative)
+    if update.geo_bounds is not None:
+        assignments["geo_bounds"] = orjson.dumps(update.geo_bounds).decode()
+
+    with closing(connect()) as conn, conn:
+        if assignments:
+            # Single primary-key lookup that also returns the updated row
+            set_clause = ", ".join(f"{column} = ?" for column in assignments)
+            row = conn.execute(
+                f"UPDATE labels SET {set_clause} WHERE id = ? "
+                f"RETURNING {', '.join(LABEL_COLUMNS)}",
+                (*assignments.values(), label_id),
+            ).fetchone()
+        else:
+            row = conn.execute(f"{_SELECT} WHERE id = ?", (label_id,)).fetchone()
+    return row_to_label(row) if row is not None else None
+
+
+def remove_labels(where: str, params: tuple) -> int:
+    """Delete labels matching a SQL WHERE clause and return the count."""
+    with closing(connect()) as conn, conn:
+        return conn.execute(f"DELETE FROM labels {where}", params).rowcount
 
 
 # --- API Endpoints ---
 
 
 @router.get("", response_model=list[Label])
-async def get_labels():
+async def get_labels(request: Request):
     """Get all labels."""
-    gdf = load_labels()
-    return gdf_to_labels(gdf)
+    etag = f'"{await asyncio.to_thread(labels_version)}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(
+        await asyncio.to_thread(query_labels_json),
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
 
 
 @router.get("/tile/{z}/{x}/{y}", response_model=list[Label])
 async def get_labels_for_tile(z: int, x: int, y: int):
     """Get labels for a specific tile."""
-    gdf = load_labels()
-    if len(gdf) == 0:
-        return []
-    mask = (gdf["tile_x"] == x) & (gdf["tile_y"] == y) & (gdf["tile_z"] == z)
-    return gdf_to_labels(gdf[mask])
+    content = await asyncio.to_thread(
+        query_labels_json, "WHERE tile_z = ? AND tile_x = ? AND tile_y = ?", (z, x, y)
+    )
+    return Response(content, media_type="application/json")
 
 
 @router.post("", response_model=Label)
 async def create_label(label: LabelCreate):
     """Create a new label."""
-    gdf = load_labels()
+    new_labels = await asyncio.to_thread(insert_labels, [label])
+    return new_labels[0]
 
-    label_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc)
 
-    # Create geometry from geo_bounds
-    geometry = box(*label.geo_bounds)
-
-    new_row = gpd.GeoDataFrame(
-        {
-            "id": [label_id],
-            "tile_x": [label.tile_x],
-            "tile_y": [label.tile_y],
-            "tile_z": [label.tile_z],
-            "pixel_bbox": [label.pixel_bbox],
-            "noun_phrase": [label.noun_phrase],
-            "is_negative": [label.is_negative],
-            "geo_bounds": [label.geo_bounds],
-            "created_at": [now],
-        },
-        geometry=[geometry],
-        crs="EPSG:4326",
-    )
-
-    gdf = pd.concat([gdf, new_row], ignore_index=True)
-    gdf = gpd.GeoDataFrame(gdf, geometry="geometry", crs="EPSG:4326")
-    save_labels(gdf)
-
-    return Label(
-        id=label_id,
-        tile_x=label.tile_x,
-        tile_y=label.tile_y,
-        tile_z=label.tile_z,
-        pixel_bbox=label.pixel_bbox,
-        noun_phrase=label.noun_phrase,
-        is_negative=label.is_negative,
-        geo_bounds=label.geo_bounds,
-        created_at=now,
-    )
+@router.post("/bulk", response_model=list[Label])
+async def create_labels_bulk(labels: list[LabelCreate]):
+    """Create several labels in one request."""
+    return await asyncio.to_thread(insert_labels, labels)
 
 
 @router.put("/{label_id}", response_model=Label)
 async def update_label(label_id: str, update: LabelUpdate):
     """Update an existing label."""
-    gdf = load_labels()
-
-    if len(gdf) == 0 or label_id not in gdf["id"].values:
+    label = await asyncio.to_thread(apply_label_update, label_id, update)
+    if label is None:
         raise HTTPException(status_code=404, detail="Label not found")
-
-    idx = gdf[gdf["id"] == label_id].index[0]
-
-    if update.pixel_bbox is not None:
-        gdf.at[idx, "pixel_bbox"] = update.pixel_bbox
-    if update.noun_phrase is not None:
-        gdf.at[idx, "noun_phrase"] = update.noun_phrase
-    if update.is_negative is not None:
-        gdf.at[idx, "is_negative"] = update.is_negative
-    if update.geo_bounds is not None:
-        gdf.at[idx, "geo_bounds"] = update.geo_bounds
-        gdf.at[idx, "geometry"] = box(*update.geo_bounds)
-
-    save_labels(gdf)
-
-    row = gdf.loc[idx]
-    return Label(
-        id=row["id"],
-        tile_x=int(row["tile_x"]),
-        tile_y=int(row["tile_y"]),
-        tile_z=int(row["tile_z"]),
-        pixel_bbox=row["pixel_bbox"],
-        noun_phrase=row["noun_phrase"] if pd.notna(row["noun_phrase"]) else None,
-        is_negative=bool(row["is_negative"]),
-        geo_bounds=row["geo_bounds"],
-        created_at=row["created_at"],
-    )
+    return label
 
 
 @router.delete("/{label_id}")
 async def delete_label(label_id: str):
     """Delete a label."""
-    gdf = load_labels()
-
-    if len(gdf) == 0 or label_id not in gdf["id"].values:
+    deleted = await asyncio.to_thread(remove_labels, "WHERE id = ?", (label_id,))
+    if deleted == 0:
         raise HTTPException(status_code=404, detail="Label not found")
-
-    gdf = gdf[gdf["id"] != label_id]
-    gdf = gpd.GeoDataFrame(gdf, geometry="geometry", crs="EPSG:4326")
-    save_labels(gdf)
-
     return {"deleted": label_id}
 
 
 @router.delete("/tile/{z}/{x}/{y}")
 async def delete_labels_for_tile(z: int, x: int, y: int):
     """Delete all labels for a specific tile."""
-    gdf = load_labels()
-
-    if len(gdf) == 0:
-        return {"deleted": 0}
-
-    mask = (gdf["tile_x"] == x) & (gdf["tile_y"] == y) & (gdf["tile_z"] == z)
-    deleted_count = mask.sum()
-
-    gdf = gdf[~mask]
-    gdf = gpd.GeoDataFrame(gdf, geometry="geometry", crs="EPSG:4326")
-    save_labels(gdf)
-
-    return {"deleted": int(deleted_count)}
-
+    deleted_count = await asyncio.to_thread(
+        remove_labels, "WHERE tile_z = ? AND tile_x = ? AND tile_y = ?", (z, x, y)
+    )
+    return {"deleted": deleted_count}
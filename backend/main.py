@@ -1,14 +1,28 @@
 """FastAPI backend for tile labeling application."""
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from config import router as config_router
 from labels import router as labels_router
-from export import router as export_router
+from export import close_http_session, router as export_router
 from titiler_router import create_titiler_router, TITILER_AVAILABLE
 
-app = FastAPI(title="Tile Labeling API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release shared resources on shutdown."""
+    yield
+    await close_http_session()
+
+
+app = FastAPI(
+    title="Tile Labeling API",
+    version="0.1.0",
+    lifespan=lifespan,
+)
 
 # CORS for frontend (allow any localhost port in development)
 app.add_middleware(
@@ -8,20 +8,43 @@ and generates corresponding COCO annotations with translated bounding boxes.
 Usage:
     uv run backend/sliding_window.py --stride 256
     uv run backend/sliding_window.py --stride 128 --tile-server-id my-server
+    uv run backend/sliding_window.py --stride 128 --format jpeg
 """
 
 import argparse
-import json
+import os
 import shutil
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
+import orjson
 from PIL import Image
 
 DATA_DIR = Path(__file__).parent.parent / "data"
 TILES_DIR = DATA_DIR / "tiles"
 COCO_FILE = DATA_DIR / "annotations.json"
 
+# Decoded source tiles kept in memory while generating windows
+TILE_CACHE_SIZE = 256
+
+# Window image formats: file extension and Pillow save options. PNG uses fast,
+# light compression since the windows are intermediate training data.
+WINDOW_FORMATS = {
+    "png": (".png", {"format": "PNG", "compress_level": 1}),
+    "jpeg": (".jpg", {"format": "JPEG", "quality": 90}),
+}
+
+# Grid positions (dx, dy) of the tiles a window can span, relative to the
+# original tile: the tile itself and its right, bottom and diagonal neighbors
+NEIGHBOR_POSITIONS = ((0, 0), (1, 0), (0, 1), (1, 1))
+
+TileCache = OrderedDict[tuple[int, int, int], Optional[np.ndarray]]
+ChunkPlan = list[tuple[int, int, tuple[slice, slice], tuple[slice, slice]]]
+
 
 def find_tiles_directory(tile_server_id: Optional[str] = None) -> Optional[Path]:
     """Find the tiles directory (may be nested under tile_server_id)."""
@@ -34,7 +57,8 @@ def find_tiles_directory(tile_server_id: Optional[str] = None) -> Optional[Path]
             return server_dir
 
     # Check if tiles are directly in tiles/ or nested under a tile_server_id
-    subdirs = [d for d in TILES_DIR.iterdir() if d.is_dir()]
+    with os.scandir(TILES_DIR) as entries:
+        subdirs = [Path(entry.path) for entry in entries if entry.is_dir()]
     if len(subdirs) == 1:
         return subdirs[0]
     elif len(subdirs) == 0:
@@ -49,20 +73,44 @@ def load_coco_annotations(coco_file: Path = COCO_FILE) -> dict:
     if not coco_file.exists():
         raise FileNotFoundError(f"COCO annotations file not found: {coco_file}")
 
-    with open(coco_file, "r") as f:
-        return json.load(f)
+    return orjson.loads(coco_file.read_bytes())
 
 
 def parse_tile_filename(filename: str) -> tuple[int, int, int]:
     """Parse z_x_y from tile filename."""
-    # Remove extension and parse
-    stem = Path(filename).stem
+    # Remove extension and parse (plain string ops; no Path objects)
+    stem = filename.rsplit("/", 1)[-1].split(".", 1)[0]
     parts = stem.split("_")
     if len(parts) >= 3:
         return int(parts[0]), int(parts[1]), int(parts[2])
     raise ValueError(f"Cannot parse tile filename: {filename}")
 
 
+def link_or_copy(src: Path, dst: Path) -> None:
+    """
+    Hardlink src to dst, falling back to a copy.
+    
+    Linking avoids rewriting tile bytes; the copy covers filesystems (or
+    output directories on another device) that don't support hardlinks.
+    """
+    if dst.exists() and src.samefile(dst):
+        return
+    # Build the new file beside dst and swap it in, so dst is never missing
+    fd, tmp_name = tempfile.mkstemp(dir=dst.parent, prefix=f".{dst.name}.", suffix=".tmp")
+    os.close(fd)
+    tmp = Path(tmp_name)
+    try:
+        tmp.unlink()
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
 def generate_window_offsets(tile_size: int, stride: int) -> list[tuple[int, int]]:
     """
     Generate window offsets for sliding window.
@@ -154,75 +202,415 @@ def translate_and_clip_bbox(
     return [x1, y1, x2 - x1, y2 - y1]
 
 
-def create_window_image(
+def decode_tile(tiles_dir: Path, z: int, x: int, y: int) -> Optional[np.ndarray]:
+    """Decode a tile as an RGB array, or return None if missing or unreadable."""
+    tile_path = tiles_dir / f"{z}_{x}_{y}.png"
+    try:
+        tile_img = Image.open(tile_path)
+        # Most map tiles are already RGB; only convert (and copy) the others
+        if tile_img.mode != "RGB":
+            tile_img = tile_img.convert("RGB")
+        return np.asarray(tile_img)
+    except Exception:
+        return None
+
+
+def cache_tile(
+    tile_cache: TileCache,
+    key: tuple[int, int, int],
+    tile: Optional[np.ndarray],
+) -> None:
+    """Add a decoded tile to the LRU cache, evicting the oldest entry if full."""
+    tile_cache[key] = tile
+    if len(tile_cache) > TILE_CACHE_SIZE:
+        tile_cache.popitem(last=False)
+
+
+def clip_bboxes_for_offsets(
+    bboxes: np.ndarray,
+    origin_x: np.ndarray,
+    origin_y: np.ndarray,
+    offsets: np.ndarray,
+    tile_size: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Translate and clip bboxes to the windows at every offset at once.
+    
+    Vectorized form of translate_and_clip_bbox over an (N, 4) array of
+    [x, y, width, height] bboxes, each given in its own tile whose pixel
+    origin relative to the original tile is (origin_x, origin_y), and a
+    (K, 2) array of window offsets.
+    
+    Returns (visible, clipped): a (K, N) mask of bboxes that remain valid
+    after clipping and whose tile is one of the window's required tiles,
+    and (K, N, 4) clipped [x, y, width, height] in window coordinates.
+    """
+    offset_x = offsets[:, 0:1]
+    offset_y = offsets[:, 1:2]
+    
+    # Offset of each annotation's tile in window coords, as computed by
+    # get_required_tiles (tile offset = src - dst)
+    new_x = bboxes[:, 0] - (offset_x - origin_x)
+    new_y = bboxes[:, 1] - (offset_y - origin_y)
+    x1 = np.maximum(new_x, 0)
+    y1 = np.maximum(new_y, 0)
+    x2 = np.minimum(new_x + bboxes[:, 2], tile_size)
+    y2 = np.minimum(new_y + bboxes[:, 3], tile_size)
+    
+    visible = (
+        (x2 > x1)
+        & (y2 > y1)
+        & ((offset_x > 0) | (origin_x == 0))
+        & ((offset_y > 0) | (origin_y == 0))
+    )
+    clipped = np.stack([x1, y1, x2 - x1, y2 - y1], axis=-1)
+    return visible, clipped
+
+
+def load_tile(
     tiles_dir: Path,
     z: int,
     x: int,
     y: int,
-    offset_x: int,
-    offset_y: int,
-    tile_size: int,
-) -> Optional[Image.Image]:
+    tile_cache: TileCache,
+) -> Optional[np.ndarray]:
     """
-    Create a window image by compositing from required tiles.
+    Load a decoded tile as an RGB array through an LRU cache.
     
-    The window starts at (offset_x, offset_y) in the original tile and
-    extends tile_size pixels, potentially spanning into neighboring tiles.
+    Returns None if the tile is missing or cannot be decoded; that result is
+    cached as well.
+    """
+    key = (z, x, y)
+    if key in tile_cache:
+        tile_cache.move_to_end(key)
+        return tile_cache[key]
+    
+    tile = decode_tile(tiles_dir, z, x, y)
+    cache_tile(tile_cache, key, tile)
+    return tile
+
+
+def prefetch_tiles(
+    tiles_dir: Path,
+    keys: list[tuple[int, int, int]],
+    tile_cache: TileCache,
+    executor: ThreadPoolExecutor,
+) -> None:
+    """
+    Decode uncached tiles concurrently and add them to the cache.
     
-    Returns None if any required tile is missing.
+    Pillow releases the GIL while inflating PNG data, so decodes overlap
+    across threads. The cache itself is only touched from the calling thread.
+    """
+    missing = [key for key in keys if key not in tile_cache]
+    decoded = executor.map(lambda key: decode_tile(tiles_dir, *key), missing)
+    for key, tile in zip(missing, decoded):
+        cache_tile(tile_cache, key, tile)
+
+
+def plan_chunks(offset_x: int, offset_y: int, tile_size: int) -> ChunkPlan:
     """
-    # Initialize output image
-    window = Image.new("RGB", (tile_size, tile_size))
+    Plan how a window at the given offset is composited from its tiles.
     
+    The plan depends only on the offset and tile size, so it can be computed
+    once per offset and shared by every window at that offset.
+    
+    Returns a list of (dx, dy, src, dst) for the non-empty chunks, where
+    (dx, dy) is the source tile's grid position relative to the original tile
+    and src/dst are (rows, cols) slices into the source tile and the window.
+    """
     # Define the 4 possible contributing chunks:
-    # (tile_x, tile_y, crop_box, paste_position)
+    # (dx, dy, crop_box, paste_position)
     # crop_box is (left, top, right, bottom) in source tile coordinates
     chunks = [
         # Top-left: from original tile
-        (x, y,
+        (0, 0,
          (offset_x, offset_y, tile_size, tile_size),
          (0, 0)),
         # Top-right: from right neighbor
-        (x + 1, y,
+        (1, 0,
          (0, offset_y, offset_x, tile_size),
          (tile_size - offset_x, 0)),
         # Bottom-left: from bottom neighbor
-        (x, y + 1,
+        (0, 1,
          (offset_x, 0, tile_size, offset_y),
          (0, tile_size - offset_y)),
         # Bottom-right: from diagonal neighbor
-        (x + 1, y + 1,
+        (1, 1,
          (0, 0, offset_x, offset_y),
          (tile_size - offset_x, tile_size - offset_y)),
     ]
     
-    for tx, ty, crop_box, paste_pos in chunks:
-        left, top, right, bottom = crop_box
-        
+    plan = []
+    for dx, dy, (left, top, right, bottom), (paste_x, paste_y) in chunks:
         # Skip chunks with zero width or height
         if right <= left or bottom <= top:
             continue
         
-        tile_path = tiles_dir / f"{z}_{tx}_{ty}.png"
-        if not tile_path.exists():
-            return None  # Missing required tile
+        src = (slice(top, bottom), slice(left, right))
+        dst = (
+            slice(paste_y, paste_y + bottom - top),
+            slice(paste_x, paste_x + right - left),
+        )
+        plan.append((dx, dy, src, dst))
+    return plan
+
+
+def create_window_image(
+    tiles_dir: Path,
+    z: int,
+    x: int,
+    y: int,
+    offset_x: int,
+    offset_y: int,
+    tile_size: int,
+    tile_cache: Optional[TileCache] = None,
+    chunk_plan: Optional[ChunkPlan] = None,
+    quadrants: Optional[set[tuple[int, int]]] = None,
+) -> Optional[np.ndarray]:
+    """
+    Create a window image by compositing from required tiles.
+    
+    The window starts at (offset_x, offset_y) in the original tile and
+    extends tile_size pixels, potentially spanning into neighboring tiles.
+    Pass a shared `tile_cache` to decode each source tile only once across
+    windows, and the offset's precomputed `chunk_plan` from plan_chunks.
+    
+    If `quadrants` is given, only chunks from those (dx, dy) grid positions
+    are read; the rest of the window is left black and their tiles are
+    neither decoded nor required to exist.
+    
+    Returns the window as a (tile_size, tile_size, 3) uint8 array, or None
+    if any required tile is missing.
+    """
+    if tile_cache is None:
+        tile_cache = OrderedDict()
+    if chunk_plan is None:
+        chunk_plan = plan_chunks(offset_x, offset_y, tile_size)
+    
+    if quadrants is None:
+        # Output pixels; the chunks below cover every one of them
+        window = np.empty((tile_size, tile_size, 3), dtype=np.uint8)
+    else:
+        window = np.zeros((tile_size, tile_size, 3), dtype=np.uint8)
+    
+    for dx, dy, src, dst in chunk_plan:
+        if quadrants is not None and (dx, dy) not in quadrants:
+            continue
         
-        try:
-            tile_img = Image.open(tile_path).convert("RGB")
-        except Exception:
-            return None
+        tile = load_tile(tiles_dir, z, x + dx, y + dy, tile_cache)
+        if tile is None:
+            return None  # Missing required tile
         
-        # Crop from source tile and paste into window
-        region = tile_img.crop(crop_box)
-        window.paste(region, paste_pos)
+        # Copy the region from the source tile straight into the window
+        window[dst] = tile[src]
     
     return window
 
 
+# Per-process inputs for window generation, set by _init_worker
+_worker_state: dict = {}
+
+
+def _init_worker(
+    tiles_dir: Path,
+    output_dir: Path,
+    tile_size: int,
+    offsets: list[tuple[int, int]],
+    annotations_by_image: dict[int, list[dict]],
+    tile_to_image_id: dict[tuple[int, int, int], int],
+    image_format: str,
+    blank_empty_quadrants: bool,
+    with_segmentation: bool,
+) -> None:
+    """Set up the shared inputs and per-process caches for a worker."""
+    _worker_state.update(
+        tiles_dir=tiles_dir,
+        output_dir=output_dir,
+        tile_size=tile_size,
+        offsets=offsets,
+        annotations_by_image=annotations_by_image,
+        tile_to_image_id=tile_to_image_id,
+        image_format=image_format,
+        blank_empty_quadrants=blank_empty_quadrants,
+        with_segmentation=with_segmentation,
+        chunk_plans={
+            offset: plan_chunks(*offset, tile_size) for offset in offsets
+        },
+        tile_cache=OrderedDict(),
+        decode_executor=ThreadPoolExecutor(max_workers=len(NEIGHBOR_POSITIONS)),
+    )
+
+
+def _shutdown_worker() -> None:
+    """Stop the decode threads and drop the caches set up by _init_worker."""
+    executor = _worker_state.get("decode_executor")
+    if executor is not None:
+        executor.shutdown()
+    _worker_state.clear()
+
+
+def _process_one_tile(
+    tile: tuple[int, int, int],
+) -> tuple[list[tuple[str, list[dict]]], int]:
+    """
+    Generate and save all sliding windows for one original tile.
+    
+    Returns ([(window_filename, annotations), ...], windows_skipped). The
+    annotation dicts have no "id" or "image_id"; those are assigned by the
+    caller so numbering stays sequential across workers.
+    """
+    tiles_dir = _worker_state["tiles_dir"]
+    output_dir = _worker_state["output_dir"]
+    tile_size = _worker_state["tile_size"]
+    annotations_by_image = _worker_state["annotations_by_image"]
+    tile_to_image_id = _worker_state["tile_to_image_id"]
+    tile_cache = _worker_state["tile_cache"]
+    extension, save_options = WINDOW_FORMATS[_worker_state["image_format"]]
+    blank_empty_quadrants = _worker_state["blank_empty_quadrants"]
+    with_segmentation = _worker_state["with_segmentation"]
+    
+    offsets = _worker_state["offsets"]
+    
+    z, x, y = tile
+    windows = []
+    windows_skipped = 0
+    
+    # Gather annotations from every labeled tile that can contribute to a
+    # window: the original tile and its right, bottom and diagonal neighbors
+    candidates = []
+    for dx, dy in NEIGHBOR_POSITIONS:
+        tile_image_id = tile_to_image_id.get((z, x + dx, y + dy))
+        if tile_image_id is None:
+            continue
+        for ann in annotations_by_image.get(tile_image_id, []):
+            candidates.append((dx, dy, ann))
+    
+    if not candidates:
+        return windows, len(offsets)
+    
+    # Decode the tiles windows are composited from up front, in parallel
+    if blank_empty_quadrants:
+        # Only tiles with annotations can end up under a visible bbox
+        prefetch_positions = sorted({(dx, dy) for dx, dy, _ in candidates})
+    else:
+        prefetch_positions = NEIGHBOR_POSITIONS
+    prefetch_tiles(
+        tiles_dir,
+        [(z, x + dx, y + dy) for dx, dy in prefetch_positions],
+        tile_cache,
+        _worker_state["decode_executor"],
+    )
+    
+    # (N, 4) [x, y, width, height] in each annotation's own tile, plus the
+    # pixel origin of that tile relative to the original tile
+    bboxes = np.array([ann["bbox"] for _, _, ann in candidates], dtype=np.float64)
+    origin_x = np.array([dx for dx, _, _ in candidates]) * tile_size
+    origin_y = np.array([dy for _, dy, _ in candidates]) * tile_size
+    # Bboxes given in whole pixels are written back out as integers
+    integral = [
+        all(isinstance(v, int) for v in ann["bbox"]) for _, _, ann in candidates
+    ]
+    
+    # Clip every bbox for every offset in one pass
+    visible, clipped_by_offset = clip_bboxes_for_offsets(
+        bboxes, origin_x, origin_y, np.array(offsets), tile_size
+    )
+    
+    # Generate windows for each offset
+    for k, (offset_x, offset_y) in enumerate(offsets):
+        
+        # Collect annotations from labeled tiles that contribute to this window
+        # We do this BEFORE creating the image to check if any annotations are visible
+        window_annotations = []
+        
+        rows = np.flatnonzero(visible[k])
+        clipped = clipped_by_offset[k, rows]
+        areas = (clipped[:, 2] * clipped[:, 3]).tolist()
+        if with_segmentation:
+            # Segmentation polygons from the clipped bboxes, all at once
+            bx, by, bw, bh = clipped.T
+            polygons = np.stack(
+                [bx, by, bx + bw, by, bx + bw, by + bh, bx, by + bh], axis=1
+            ).tolist()
+        
+        for j, (i, new_bbox) in enumerate(zip(rows.tolist(), clipped.tolist())):
+            ann = candidates[i][2]
+            if integral[i]:
+                new_bbox = [int(v) for v in new_bbox]
+            
+            window_ann = {
+                "category_id": ann["category_id"],
+                "bbox": new_bbox,
+            }
+            if with_segmentation:
+                polygon = polygons[j]
+                if integral[i]:
+                    polygon = [int(v) for v in polygon]
+                window_ann["segmentation"] = [polygon]
+            window_ann["area"] = areas[j]
+            window_ann["iscrowd"] = 0
+            window_ann["noun_phrase"] = ann.get("noun_phrase", "")
+            window_annotations.append(window_ann)
+        
+        # Skip windows that don't intersect any annotations from labeled tiles
+        if not window_annotations:
+            windows_skipped += 1
+            continue
+        
+        chunk_plan = _worker_state["chunk_plans"][(offset_x, offset_y)]
+        
+        # Optionally only read the chunks that some visible bbox overlaps
+        quadrants = None
+        if blank_empty_quadrants:
+            quadrants = {
+                (dx, dy)
+                for dx, dy, _, (dst_rows, dst_cols) in chunk_plan
+                if np.any(
+                    (clipped[:, 0] < dst_cols.stop)
+                    & (clipped[:, 0] + clipped[:, 2] > dst_cols.start)
+                    & (clipped[:, 1] < dst_rows.stop)
+                    & (clipped[:, 1] + clipped[:, 3] > dst_rows.start)
+                )
+            }
+        
+        # Now create the window image (checks that tiles exist on disk)
+        window_img = create_window_image(
+            tiles_dir,
+            z,
+            x,
+            y,
+            offset_x,
+            offset_y,
+            tile_size,
+            tile_cache,
+            chunk_plan,
+            quadrants,
+        )
+        
+        if window_img is None:
+            windows_skipped += 1
+            continue
+        
+        # Generate filename for window
+        window_filename = f"{z}_{x}_{y}_w{offset_x}_{offset_y}{extension}"
+        window_path = output_dir / window_filename
+        
+        # Save window image
+        Image.fromarray(window_img).save(window_path, **save_options)
+        windows.append((window_filename, window_annotations))
+    
+    return windows, windows_skipped
+
+
 def process_sliding_windows(
     stride: int,
     tile_server_id: Optional[str] = None,
     output_dir: Optional[Path] = None,
+    workers: Optional[int] = None,
+    image_format: str = "png",
+    blank_empty_quadrants: bool = False,
+    with_segmentation: bool = True,
 ) -> None:
     """
     Main processing function to generate sliding window tiles and annotations.
@@ -231,7 +619,16 @@ def process_sliding_windows(
     - Original labeled tiles (copied to output directory)
     - Sliding window tiles (composited from neighboring tiles)
     - Combined COCO annotations for all images
+    
+    Windows are generated in `workers` processes (default: one per CPU) and
+    saved in `image_format` ("png" or "jpeg"). With `blank_empty_quadrants`,
+    window regions that no visible bbox overlaps are left black instead of
+    being decoded from their source tile. Without `with_segmentation`,
+    annotations carry no "segmentation" polygons (detection-only datasets).
     """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    
     # Find tiles directory
     tiles_dir = find_tiles_directory(tile_server_id)
     if tiles_dir is None:
@@ -260,21 +657,24 @@ def process_sliding_windows(
         output_dir = DATA_DIR / "sliding_windows"
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Build image_id -> image mapping
-    images_by_id = {img["id"]: img for img in coco_data["images"]}
+    # Parse each image's file name once: (image, basename, (z, x, y) or None)
+    parsed_images: list[tuple[dict, str, Optional[tuple[int, int, int]]]] = []
+    for img in coco_data["images"]:
+        basename = img["file_name"].rsplit("/", 1)[-1]
+        try:
+            coords = parse_tile_filename(basename)
+        except ValueError:
+            coords = None
+        parsed_images.append((img, basename, coords))
     
     # Build set of available tile coordinates from labeled images
     # This ensures we only create windows where ALL required tiles have labels
     available_tiles: set[tuple[int, int, int]] = set()
     tile_to_image_id: dict[tuple[int, int, int], int] = {}
-    for img in coco_data["images"]:
-        try:
-            basename = Path(img["file_name"]).name
-            z, x, y = parse_tile_filename(basename)
-            available_tiles.add((z, x, y))
-            tile_to_image_id[(z, x, y)] = img["id"]
-        except ValueError:
-            pass
+    for img, _, coords in parsed_images:
+        if coords is not None:
+            available_tiles.add(coords)
+            tile_to_image_id[coords] = img["id"]
     
     print(f"Available labeled tiles: {len(available_tiles)}")
     
@@ -300,17 +700,15 @@ def process_sliding_windows(
     
     # First, copy all original tiles and their annotations
     print("\nCopying original tiles...")
-    for orig_image in coco_data["images"]:
+    for orig_image, basename, _ in parsed_images:
         orig_image_id = orig_image["id"]
-        filename = orig_image["file_name"]
-        basename = Path(filename).name
         
         # Copy original tile to output
         src_path = tiles_dir / basename
         dst_path = output_dir / basename
         
         if src_path.exists():
-            shutil.copy2(src_path, dst_path)
+            link_or_copy(src_path, dst_path)
             originals_copied += 1
             
             # Add to new images list
@@ -324,23 +722,24 @@ def process_sliding_windows(
             # Copy annotations for this original tile
             for orig_ann in annotations_by_image.get(orig_image_id, []):
                 bx, by, bw, bh = orig_ann["bbox"]
-                segmentation = orig_ann.get("segmentation", [[
-                    bx, by,
-                    bx + bw, by,
-                    bx + bw, by + bh,
-                    bx, by + bh,
-                ]])
                 
-                new_annotations.append({
+                new_ann = {
                     "id": new_annotation_id,
                     "image_id": new_image_id,
                     "category_id": orig_ann["category_id"],
                     "bbox": orig_ann["bbox"],
-                    "segmentation": segmentation,
-                    "area": orig_ann.get("area", float(bw * bh)),
-                    "iscrowd": orig_ann.get("iscrowd", 0),
-                    "noun_phrase": orig_ann.get("noun_phrase", ""),
-                })
+                }
+                if with_segmentation:
+                    new_ann["segmentation"] = orig_ann.get("segmentation", [[
+                        bx, by,
+                        bx + bw, by,
+                        bx + bw, by + bh,
+                        bx, by + bh,
+                    ]])
+                new_ann["area"] = orig_ann.get("area", float(bw * bh))
+                new_ann["iscrowd"] = orig_ann.get("iscrowd", 0)
+                new_ann["noun_phrase"] = orig_ann.get("noun_phrase", "")
+                new_annotations.append(new_ann)
                 new_annotation_id += 1
                 annotations_created += 1
             
@@ -348,110 +747,71 @@ def process_sliding_windows(
         else:
             print(f"  Warning: Original tile not found: {src_path}")
     
-    # Now generate sliding window tiles
+    # Now generate sliding window tiles, one job per original tile
     print("\nGenerating sliding window tiles...")
-    for orig_image in coco_data["images"]:
-        orig_image_id = orig_image["id"]
-        filename = orig_image["file_name"]
-        
-        # Parse tile coordinates
-        try:
-            basename = Path(filename).name
-            z, x, y = parse_tile_filename(basename)
-        except ValueError as e:
-            print(f"Warning: {e}")
+    jobs = []
+    for _, basename, coords in parsed_images:
+        if coords is None:
+            print(f"Warning: Cannot parse tile filename: {basename}")
             continue
-        
-        # Generate windows for each offset
-        for offset_x, offset_y in offsets:
-            
-            # Get required tiles info for annotation collection
-            required_tiles = get_required_tiles(z, x, y, offset_x, offset_y, tile_size)
-            
-            # Collect annotations from labeled tiles that contribute to this window
-            # We do this BEFORE creating the image to check if any annotations are visible
-            window_annotations = []
-            temp_annotation_id = new_annotation_id
-            
-            for tz, tx, ty, src_x, src_y, dst_x, dst_y in required_tiles:
-                tile_image_id = tile_to_image_id.get((tz, tx, ty))
-                if tile_image_id is None:
-                    continue
-                
-                tile_annotations = annotations_by_image.get(tile_image_id, [])
-                
-                for ann in tile_annotations:
-                    # Calculate offset for this tile's annotations in window coords
-                    # The tile's (0,0) maps to (dst_x - src_x, dst_y - src_y) in window coords
-                    tile_offset_x = src_x - dst_x
-                    tile_offset_y = src_y - dst_y
-                    
-                    new_bbox = translate_and_clip_bbox(
-                        ann["bbox"],
-                        tile_offset_x,
-                        tile_offset_y,
-                        tile_size,
-                    )
-                    
-                    if new_bbox is None:
-                        continue  # Annotation outside window
-                    
-                    # Create segmentation polygon from clipped bbox
-                    bx, by, bw, bh = new_bbox
-                    segmentation = [[
-                        bx, by,
-                        bx + bw, by,
-                        bx + bw, by + bh,
-                        bx, by + bh,
-                    ]]
-                    
-                    window_annotations.append({
-                        "id": temp_annotation_id,
+        jobs.append(coords)
+    
+    # Process tiles row by row (z, y, x): the next tile in a row reuses its
+    # left neighbor's right-hand tiles, and the following row reuses this
+    # row's bottom tiles while they are still in the LRU cache
+    jobs.sort(key=lambda tile: (tile[0], tile[2], tile[1]))
+    
+    worker_args = (
+        tiles_dir,
+        output_dir,
+        tile_size,
+        offsets,
+        annotations_by_image,
+        tile_to_image_id,
+        image_format,
+        blank_empty_quadrants,
+        with_segmentation,
+    )
+    if workers > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=worker_args,
+        )
+        # Contiguous chunks give each worker a band of rows for its cache
+        chunksize = max(1, len(jobs) // (workers * 4))
+        results = executor.map(_process_one_tile, jobs, chunksize=chunksize)
+    else:
+        executor = None
+        _init_worker(*worker_args)
+        results = map(_process_one_tile, jobs)
+    
+    try:
+        # Results arrive in job order, so IDs are assigned deterministically
+        for windows, skipped in results:
+            windows_skipped += skipped
+            for window_filename, window_annotations in windows:
+                windows_created += 1
+                new_images.append({
+                    "id": new_image_id,
+                    "file_name": window_filename,
+                    "width": tile_size,
+                    "height": tile_size,
+                })
+                for ann in window_annotations:
+                    new_annotations.append({
+                        "id": new_annotation_id,
                         "image_id": new_image_id,
-                        "category_id": ann["category_id"],
-                        "bbox": new_bbox,
-                        "segmentation": segmentation,
-                        "area": float(bw * bh),
-                        "iscrowd": 0,
-                        "noun_phrase": ann.get("noun_phrase", ""),
+                        **ann,
                     })
-                    temp_annotation_id += 1
-            
-            # Skip windows that don't intersect any annotations from labeled tiles
-            if not window_annotations:
-                windows_skipped += 1
-                continue
-            
-            # Now create the window image (checks that tiles exist on disk)
-            window_img = create_window_image(
-                tiles_dir, z, x, y, offset_x, offset_y, tile_size
-            )
-            
-            if window_img is None:
-                windows_skipped += 1
-                continue
-            
-            # Generate filename for window
-            window_filename = f"{z}_{x}_{y}_w{offset_x}_{offset_y}.png"
-            window_path = output_dir / window_filename
-            
-            # Save window image
-            window_img.save(window_path)
-            windows_created += 1
-            
-            # Add to new images list
-            new_images.append({
-                "id": new_image_id,
-                "file_name": window_filename,
-                "width": tile_size,
-                "height": tile_size,
-            })
-            
-            # Finalize annotation IDs and add to list
-            new_annotation_id = temp_annotation_id
-            annotations_created += len(window_annotations)
-            new_annotations.extend(window_annotations)
-            new_image_id += 1
+                    new_annotation_id += 1
+                annotations_created += len(window_annotations)
+                new_image_id += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        else:
+            _shutdown_worker()
     
     # Create new COCO JSON
     new_coco_data = {
@@ -466,8 +826,9 @@ def process_sliding_windows(
     
     # Save new COCO JSON
     output_coco_path = output_dir / "annotations.json"
-    with open(output_coco_path, "w") as f:
-        json.dump(new_coco_data, f, indent=2)
+    output_coco_path.write_bytes(
+        orjson.dumps(new_coco_data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+    )
     
     print(f"\nResults:")
     print(f"  Original tiles copied: {originals_copied}")
@@ -501,6 +862,32 @@ def main():
         default=None,
         help="Output directory (defaults to data/sliding_windows)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes for window generation (defaults to CPU count)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(WINDOW_FORMATS),
+        default="png",
+        help="Image format for sliding window tiles (jpeg encodes faster)",
+    )
+    parser.add_argument(
+        "--blank-empty-quadrants",
+        action="store_true",
+        help=(
+            "Leave window regions without visible annotations black instead "
+            "of decoding their source tiles"
+        ),
+    )
+    parser.add_argument(
+        "--no-segmentation",
+        dest="with_segmentation",
+        action="store_false",
+        help="Omit segmentation polygons from annotations (bbox-only detection data)",
+    )
     
     args = parser.parse_args()
     
@@ -510,6 +897,10 @@ def main():
         stride=args.stride,
         tile_server_id=args.tile_server_id,
         output_dir=output_dir,
+        workers=args.workers,
+        image_format=args.format,
+        blank_empty_quadrants=args.blank_empty_quadrants,
+        with_segmentation=args.with_segmentation,
     )
 
 
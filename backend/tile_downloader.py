@@ -1,9 +1,14 @@
 """Async tile downloader with progress tracking."""
 
 import asyncio
+import math
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
 from dataclasses import dataclass
 from pathlib import Path
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 
 import aiohttp
 from morecantile import Tile, tms
@@ -30,24 +35,204 @@ class TileDownloadResult:
     filepath: str | None = None
     error: str | None = None
     skipped: bool = False
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+# Download bodies are streamed to disk in chunks of this size
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Tiles larger than this are rejected rather than written
+MAX_TILE_BYTES = 32 * 1024 * 1024
+
+# Sidecar database in each tile directory holding the ETag/Last-Modified
+# validators of downloaded tiles, used for conditional re-downloads
+VALIDATORS_DB = ".validators.db"
+
+# (etag, last_modified) for a tile file
+Validators = tuple[Optional[str], Optional[str]]
+
+
+def connect_validators(output_dir: Path) -> sqlite3.Connection:
+    """Open the validators database of a tile directory."""
+    conn = sqlite3.connect(output_dir / VALIDATORS_DB)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS validators ("
+        "filename TEXT PRIMARY KEY, etag TEXT, last_modified TEXT)"
+    )
+    return conn
+
+
+def load_validators(output_dir: Path) -> dict[str, Validators]:
+    """Load the stored validators of a tile directory, keyed by filename."""
+    if not (output_dir / VALIDATORS_DB).exists():
+        return {}
+    with closing(connect_validators(output_dir)) as conn:
+        rows = conn.execute("SELECT filename, etag, last_modified FROM validators")
+        return {filename: (etag, last_modified) for filename, etag, last_modified in rows}
+
+
+def save_validators(output_dir: Path, updates: dict[str, Validators]) -> None:
+    """Store validators for newly downloaded tiles in one transaction.
+
+    Tiles downloaded without any validators have their stored row removed, so
+    a replaced file is never revalidated against its predecessor's ETag.
+    """
+    stored = {name: v for name, v in updates.items() if v[0] or v[1]}
+    if not stored and not (output_dir / VALIDATORS_DB).exists():
+        return
+    with closing(connect_validators(output_dir)) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO validators (filename, etag, last_modified) "
+            "VALUES (?, ?, ?)",
+            [(filename, *validators) for filename, validators in stored.items()],
+        )
+        conn.executemany(
+            "DELETE FROM validators WHERE filename = ?",
+            [(filename,) for filename in updates if filename not in stored],
+        )
+
+
+# tms.get() builds a new TileMatrixSet on every call, so look it up once
+WEB_MERCATOR = tms.get("WebMercatorQuad")
+
+# Latitude limit of the Web Mercator tile grid
+MAX_LATITUDE = math.degrees(math.atan(math.sinh(math.pi)))
+# Nudge applied to bbox edges (as morecantile does) so that the bounds of a
+# single tile select exactly that tile
+LL_EPSILON = 1e-11
+
+
+def lnglat_to_tile_xy(lng: float, lat: float, zoom: int) -> tuple[int, int]:
+    """Web Mercator tile column and row containing a point, clamped to the grid."""
+    n = 1 << zoom
+    x = math.floor((lng + 180.0) / 360.0 * n)
+    y = math.floor((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
 
 
 def get_tiles_in_bbox(
     west: float, south: float, east: float, north: float, zoom: int
 ) -> list[Tile]:
-    """Get all tiles at given zoom level within bounding box."""
-    web_mercator = tms.get("WebMercatorQuad")
-    tiles = list(web_mercator.tiles(west, south, east, north, zooms=[zoom]))
+    """Get all tiles at given zoom level within bounding box.
+
+    Uses the closed-form Web Mercator tile math rather than morecantile's
+    projection-based enumeration; bboxes crossing the antimeridian
+    (west > east) are split in two.
+
+    Longitudes outside [-180, 180] are wrapped onto the globe first (e.g. 190
+    becomes -170), and a bbox spanning 360 degrees or more covers every
+    column. morecantile does not wrap such longitudes, so results differ from
+    it there; in-range bboxes match it exactly.
+    """
+    if east - west >= 360.0:
+        west, east = -180.0, 180.0
+    if not -180.0 <= west <= 180.0:
+        west = (west + 180.0) % 360.0 - 180.0
+    if not -180.0 <= east <= 180.0:
+        east = 180.0 - (180.0 - east) % 360.0
+
+    if west > east:
+        bboxes = [(-180.0, south, east, north), (west, south, 180.0, north)]
+    else:
+        bboxes = [(west, south, east, north)]
+
+    tiles = []
+    for w, s, e, n in bboxes:
+        # Clamp to the grid's extent
+        w = max(-180.0, w)
+        s = max(-MAX_LATITUDE, s)
+        e = min(180.0, e)
+        n = min(MAX_LATITUDE, n)
+
+        nw_x, nw_y = lnglat_to_tile_xy(w + LL_EPSILON, n - LL_EPSILON, zoom)
+        se_x, se_y = lnglat_to_tile_xy(e - LL_EPSILON, s + LL_EPSILON, zoom)
+        # The nudges can cross over for zero-width or zero-height bboxes
+        min_x, max_x = min(nw_x, se_x), max(nw_x, se_x)
+        min_y, max_y = min(nw_y, se_y), max(nw_y, se_y)
+        tiles.extend(
+            Tile(x, y, zoom)
+            for y in range(min_y, max_y + 1)
+            for x in range(min_x, max_x + 1)
+        )
     return tiles
 
 
 def tile_to_bounds(tile: Tile) -> tuple[float, float, float, float]:
     """Get the geographic bounds of a tile."""
-    web_mercator = tms.get("WebMercatorQuad")
-    bounds = web_mercator.bounds(tile)
+    bounds = WEB_MERCATOR.bounds(tile)
     return (bounds.left, bounds.bottom, bounds.right, bounds.top)
 
 
+# Seconds an idle keep-alive connection stays in the pool, long enough to be
+# reused by the next download request rather than reconnecting
+KEEPALIVE_TIMEOUT = 60
+# Seconds resolved tile server addresses are cached (aiohttp default: 10)
+DNS_CACHE_TTL = 300
+
+
+def create_session(max_connections: int = 100) -> aiohttp.ClientSession:
+    """Create an HTTP session whose connection pool can be shared by downloads."""
+    connector = aiohttp.TCPConnector(
+        limit=max_connections,
+        # Downloads usually target a single tile server
+        limit_per_host=max_connections,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        use_dns_cache=True,
+        ttl_dns_cache=DNS_CACHE_TTL,
+    )
+    timeout = aiohttp.ClientTimeout(total=60)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def warm_up(session: aiohttp.ClientSession, url: str) -> None:
+    """Resolve and connect to a tile server with a single HEAD request.
+
+    Run before fanning out so the concurrent downloads find the address in
+    the DNS cache and a live connection in the pool. Failures are ignored;
+    the downloads report their own errors.
+    """
+    try:
+        async with session.head(url, timeout=aiohttp.ClientTimeout(total=5)):
+            pass
+    except Exception:
+        pass
+
+
+async def stream_to_disk(response: aiohttp.ClientResponse, filepath: Path) -> None:
+    """Stream a response body to a file without buffering it in memory.
+
+    The body is written to a temporary file that replaces `filepath` once
+    complete, so an interrupted download never leaves a truncated tile.
+    """
+    if (response.content_length or 0) > MAX_TILE_BYTES:
+        raise ValueError(f"Tile exceeds {MAX_TILE_BYTES} bytes")
+
+    # File I/O runs in worker threads so slow disks don't stall the loop.
+    # A unique name per download, so concurrent fetches of a tile don't collide
+    f = await asyncio.to_thread(
+        tempfile.NamedTemporaryFile,
+        dir=filepath.parent,
+        prefix=f".{filepath.name}.",
+        suffix=".tmp",
+        delete=False,
+    )
+    tmp_path = Path(f.name)
+    try:
+        size = 0
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_TILE_BYTES:
+                raise ValueError(f"Tile exceeds {MAX_TILE_BYTES} bytes")
+            await asyncio.to_thread(f.write, chunk)
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.replace, tmp_path, filepath)
+    except BaseException:
+        f.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
 async def download_single_tile(
     session: aiohttp.ClientSession,
     tile: Tile,
@@ -55,13 +240,25 @@ async def download_single_tile(
     output_dir: Path,
     semaphore: asyncio.Semaphore,
     skip_existing: bool = True,
+    existing_files: Optional[set[str]] = None,
+    validators: Optional[Validators] = None,
 ) -> TileDownloadResult:
-    """Download a single tile."""
+    """Download a single tile.
+
+    If `existing_files` is given it is used instead of a per-tile stat to
+    decide whether the tile is already on disk. When an existing tile is not
+    skipped, its stored `validators` make the request conditional and a
+    304 Not Modified response counts as skipped.
+    """
     filename = f"{tile.z}_{tile.x}_{tile.y}.png"
     filepath = output_dir / filename
 
     # Skip if already exists
-    if skip_existing and filepath.exists():
+    if existing_files is not None:
+        already_exists = filename in existing_files
+    else:
+        already_exists = filepath.exists()
+    if skip_existing and already_exists:
         return TileDownloadResult(
             tile=tile,
             success=True,
@@ -71,16 +268,32 @@ async def download_single_tile(
 
     url = url_template.format(z=tile.z, x=tile.x, y=tile.y)
 
+    headers = {}
+    if already_exists and validators is not None:
+        etag, last_modified = validators
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
     async with semaphore:
         try:
-            async with session.get(url) as response:
+            async with session.get(url, headers=headers) as response:
                 if response.status == 200:
-                    content = await response.read()
-                    filepath.write_bytes(content)
+                    await stream_to_disk(response, filepath)
                     return TileDownloadResult(
                         tile=tile,
                         success=True,
                         filepath=str(filepath),
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                    )
+                elif response.status == 304:
+                    return TileDownloadResult(
+                        tile=tile,
+                        success=True,
+                        filepath=str(filepath),
+                        skipped=True,
                     )
                 else:
                     return TileDownloadResult(
@@ -102,13 +315,30 @@ async def download_tiles_with_progress(
     output_dir: Path,
     max_concurrent: int = 50,
     skip_existing: bool = True,
+    session: Optional[aiohttp.ClientSession] = None,
+    revalidate: bool = False,
 ) -> AsyncGenerator[DownloadProgress, None]:
-    """Download tiles with progress updates via async generator."""
+    """Download tiles with progress updates via async generator.
+
+    Pass a long-lived `session` to reuse its open connections across calls;
+    otherwise a session is created for this call and closed afterwards.
+
+    With `revalidate`, tiles already on disk are re-requested conditionally
+    using the ETag/Last-Modified stored when they were downloaded, and are
+    only rewritten if the server has a newer version.
+    """
     output_dir.mkdir(parents=True, exist_ok=True)
+    if revalidate:
+        skip_existing = False
+
+    # One directory listing instead of a stat per tile
+    with os.scandir(output_dir) as entries:
+        existing_files = {entry.name for entry in entries}
+
+    validators = await asyncio.to_thread(load_validators, output_dir)
+    new_validators: dict[str, Validators] = {}
 
     semaphore = asyncio.Semaphore(max_concurrent)
-    connector = aiohttp.TCPConnector(limit=max_concurrent)
-    timeout = aiohttp.ClientTimeout(total=60)
 
     total = len(tiles)
     completed = 0
@@ -123,13 +353,37 @@ async def download_tiles_with_progress(
         skipped=0,
     )
 
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+    owns_session = session is None
+    if owns_session:
+        session = create_session(max_concurrent)
+
+    tasks: list[asyncio.Task] = []
+    try:
+        # Prime DNS and the pool using the first tile that will be fetched
+        first = next(
+            (
+                tile
+                for tile in tiles
+                if not skip_existing
+                or f"{tile.z}_{tile.x}_{tile.y}.png" not in existing_files
+            ),
+            None,
+        )
+        if first is not None:
+            await warm_up(session, url_template.format(z=first.z, x=first.x, y=first.y))
+
         # Create tasks for all tiles
-        tasks = []
         for tile in tiles:
             task = asyncio.create_task(
                 download_single_tile(
-                    session, tile, url_template, output_dir, semaphore, skip_existing
+                    session,
+                    tile,
+                    url_template,
+                    output_dir,
+                    semaphore,
+                    skip_existing,
+                    existing_files,
+                    validators.get(f"{tile.z}_{tile.x}_{tile.y}.png"),
                 )
             )
             tasks.append(task)
@@ -142,6 +396,11 @@ async def download_tiles_with_progress(
                 failed += 1
             elif result.skipped:
                 skipped += 1
+            else:
+                new_validators[Path(result.filepath).name] = (
+                    result.etag,
+                    result.last_modified,
+                )
 
             yield DownloadProgress(
                 total=total,
@@ -151,4 +410,12 @@ async def download_tiles_with_progress(
                 current_tile=f"{result.tile.z}/{result.tile.x}/{result.tile.y}",
                 error=result.error,
             )
+    finally:
+        # Stop the remaining downloads if the consumer went away early
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(save_validators, output_dir, new_validators)
+        if owns_session:
+            await session.close()
 
@@ -8,46 +8,159 @@ This module provides endpoints for:
 To enable, install with: uv pip install -e ".[titiler]"
 """
 
-import json
+import asyncio
+import bisect
+import functools
+import math
+import sqlite3
+import threading
+import time
 import uuid
+from contextlib import closing
 from pathlib import Path
+from typing import Optional
 
+import orjson
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
-# Registry file for tracking registered GeoTIFFs
+# Registry database for tracking registered GeoTIFFs
 DATA_DIR = Path(__file__).parent.parent / "data"
-REGISTRY_FILE = DATA_DIR / "geotiff_registry.json"
+REGISTRY_DB = DATA_DIR / "registry.db"
+# Earlier registry formats, imported into a fresh database on first use
+NDJSON_REGISTRY_FILE = DATA_DIR / "geotiff_registry.ndjson"
+LEGACY_REGISTRY_FILE = DATA_DIR / "geotiff_registry.json"
+
+REGISTRY_COLUMNS = (
+    "id",
+    "filename",
+    "path",
+    "tile_url_template",
+    "bounds",
+    "min_zoom",
+    "max_zoom",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS geotiffs (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    tile_url_template TEXT NOT NULL,
+    bounds TEXT NOT NULL,
+    min_zoom INTEGER NOT NULL,
+    max_zoom INTEGER NOT NULL
+);
+"""
+
+_SELECT = f"SELECT {', '.join(REGISTRY_COLUMNS)} FROM geotiffs"
+_INSERT = (
+    f"INSERT OR IGNORE INTO geotiffs ({', '.join(REGISTRY_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(REGISTRY_COLUMNS))})"
+)
 
+_db_lock = threading.Lock()
+_db_initialized = False
 
-def load_registry() -> dict[str, dict]:
-    """Load the GeoTIFF registry from disk."""
-    if REGISTRY_FILE.exists():
-        return json.loads(REGISTRY_FILE.read_text())
-    return {}
 
+def connect_registry() -> sqlite3.Connection:
+    """Open the registry database, creating the schema on first use.
 
-def save_registry(registry: dict[str, dict]):
-    """Save the GeoTIFF registry to disk."""
+    A new database is seeded from a registry file written by earlier versions.
+    """
+    global _db_initialized
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    REGISTRY_FILE.write_text(json.dumps(registry, indent=2))
+    with _db_lock:
+        is_new = not REGISTRY_DB.exists()
+        conn = sqlite3.connect(REGISTRY_DB)
+        if is_new or not _db_initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            if is_new:
+                with conn:
+                    conn.executemany(
+                        _INSERT, [entry_to_row(e) for e in _legacy_entries()]
+                    )
+            _db_initialized = True
+    return conn
+
+
+def _legacy_entries() -> list[dict]:
+    """Read entries from an NDJSON or single-object JSON registry file."""
+    if NDJSON_REGISTRY_FILE.exists():
+        with NDJSON_REGISTRY_FILE.open("rb") as f:
+            return [orjson.loads(line) for line in f if line.strip()]
+    if LEGACY_REGISTRY_FILE.exists():
+        return list(orjson.loads(LEGACY_REGISTRY_FILE.read_bytes()).values())
+    return []
+
+
+def entry_to_row(entry: dict) -> tuple:
+    """Convert a registry entry to a database row."""
+    row = dict(entry, bounds=orjson.dumps(entry["bounds"]).decode())
+    return tuple(row[column] for column in REGISTRY_COLUMNS)
+
+
+def row_to_entry(row: tuple) -> dict:
+    """Convert a database row to a registry entry."""
+    entry = dict(zip(REGISTRY_COLUMNS, row))
+    entry["bounds"] = orjson.loads(entry["bounds"])
+    return entry
+
+
+def list_entries() -> list[dict]:
+    """All registry entries, in registration order."""
+    with closing(connect_registry()) as conn:
+        rows = conn.execute(f"{_SELECT} ORDER BY rowid").fetchall()
+    return [row_to_entry(row) for row in rows]
+
+
+def get_entry(file_id: str) -> Optional[dict]:
+    """Look up one registry entry by id."""
+    with closing(connect_registry()) as conn:
+        row = conn.execute(f"{_SELECT} WHERE id = ?", (file_id,)).fetchone()
+    return row_to_entry(row) if row else None
+
+
+def insert_entry(entry: dict) -> bool:
+    """Add an entry to the registry, returning False if its id is taken."""
+    with closing(connect_registry()) as conn, conn:
+        cursor = conn.execute(_INSERT, entry_to_row(entry))
+    return cursor.rowcount > 0
+
+
+def delete_entry(file_id: str) -> Optional[str]:
+    """Remove an entry from the registry, returning its path if it existed."""
+    with closing(connect_registry()) as conn, conn:
+        row = conn.execute(
+            "SELECT path FROM geotiffs WHERE id = ?", (file_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("DELETE FROM geotiffs WHERE id = ?", (file_id,))
+    return row[0]
 
 
 # Check if TiTiler is available
 try:
     from titiler.core.factory import TilerFactory
     import rasterio
+    from rasterio.warp import transform_bounds
 
     TITILER_AVAILABLE = True
 except ImportError:
     TITILER_AVAILABLE = False
     TilerFactory = None
     rasterio = None
+    transform_bounds = None
 
 
 class GeoTiffInfo(BaseModel):
     """Information about a registered GeoTIFF."""
 
+    model_config = ConfigDict(defer_build=True)
+
     id: str
     filename: str
     path: str
@@ -60,45 +173,136 @@ class GeoTiffInfo(BaseModel):
 class RegisterRequest(BaseModel):
     """Request to register a local GeoTIFF file."""
 
+    model_config = ConfigDict(defer_build=True)
+
     path: str
 
 
 class GeoTiffListResponse(BaseModel):
     """Response for listing GeoTIFFs."""
 
+    model_config = ConfigDict(defer_build=True)
+
     geotiffs: list[GeoTiffInfo]
     titiler_available: bool
 
 
-def get_geotiff_bounds(filepath: Path) -> tuple[list[float], int, int]:
-    """Get bounds and recommended zoom levels from a GeoTIFF.
+GEOTIFF_SUFFIXES = frozenset({".tif", ".tiff", ".geotiff"})
 
-    Returns (bounds, min_zoom, max_zoom).
+
+# Recent existence checks for registered files, as path -> (checked_at, exists),
+# so polling the GeoTIFF list doesn't stat every file on every request.
+EXISTS_TTL = 5.0
+_exists_cache: dict[str, tuple[float, bool]] = {}
+
+
+# Existence checks that may run in worker threads at once
+EXISTS_CHECK_CONCURRENCY = 16
+
+
+def cached_exists(path: str) -> Optional[bool]:
+    """A file's existence if it was checked within EXISTS_TTL, else None."""
+    cached = _exists_cache.get(path)
+    if cached is not None and time.monotonic() - cached[0] < EXISTS_TTL:
+        return cached[1]
+    return None
+
+
+def check_exists(path: str) -> bool:
+    """Check whether a file exists and remember the result."""
+    exists = Path(path).exists()
+    _exists_cache[path] = (time.monotonic(), exists)
+    return exists
+
+
+def prune_exists_cache():
+    """Drop expired existence checks, so unlisted paths don't accumulate."""
+    now = time.monotonic()
+    # Snapshot the items, since checks may be adding entries from threads
+    for path, (checked_at, _) in list(_exists_cache.items()):
+        if now - checked_at >= EXISTS_TTL:
+            _exists_cache.pop(path, None)
+
+
+# Web Mercator meters per pixel at the equator for zooms 22 down to 0
+_ZOOM_RESOLUTIONS = tuple(156543.0 / 2**zoom for zoom in range(22, -1, -1))
+METERS_PER_DEGREE = 111320
+EARTH_RADIUS = 6378137.0
+
+
+def _lnglat_bounds(crs, bounds) -> tuple[float, ...]:
+    """Reproject (left, bottom, right, top) bounds to EPSG:4326.
+
+    Geographic and Web Mercator bounds are converted directly, which avoids
+    setting up a PROJ transformation for the most common GeoTIFF CRSs.
     """
-    if not TITILER_AVAILABLE:
-        return [-180.0, -85.0, 180.0, 85.0], 0, 22
+    epsg = crs.to_epsg()
+    if epsg == 4326:
+        return tuple(bounds)
+    if epsg == 3857:
+        west, south, east, north = bounds
+        return (
+            math.degrees(west / EARTH_RADIUS),
+            math.degrees(math.atan(math.sinh(south / EARTH_RADIUS))),
+            math.degrees(east / EARTH_RADIUS),
+            math.degrees(math.atan(math.sinh(north / EARTH_RADIUS))),
+        )
 
-    try:
-        with rasterio.open(filepath) as src:
-            from rasterio.warp import transform_bounds
+    return tuple(transform_bounds(crs, "EPSG:4326", *bounds))
+
+
+@functools.lru_cache(maxsize=512)
+def _bounds_cached(
+    path: str, mtime: int, size: int
+) -> tuple[tuple[float, ...], int, int]:
+    """Read bounds and zoom levels for one version of a GeoTIFF.
+
+    The file's mtime and size are part of the cache key, so a rewritten file
+    is read again.
+    """
+    with rasterio.open(path) as src:
+        bounds = _lnglat_bounds(src.crs, src.bounds)
+
+        transform = src.transform
+        pixel_size = abs(transform.a)
+
+        if src.crs.is_geographic:
+            # A degree of longitude spans the same Web Mercator distance at
+            # every latitude
+            pixel_size_meters = pixel_size * METERS_PER_DEGREE
+        else:
+            pixel_size_meters = pixel_size * src.crs.linear_units_factor[1]
+            if src.crs.to_epsg() != 3857:
+                # Ground distances are stretched by 1/cos(lat) in Web Mercator
+                center_lat = (bounds[1] + bounds[3]) / 2
+                pixel_size_meters /= math.cos(math.radians(center_lat))
 
-            bounds = transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+        if pixel_size_meters > 0:
+            # Deepest zoom whose resolution is still no finer than the source
+            finer = bisect.bisect_left(_ZOOM_RESOLUTIONS, pixel_size_meters)
+            max_zoom = max(0, len(_ZOOM_RESOLUTIONS) - 1 - finer)
+        else:
+            max_zoom = 18
 
-            transform = src.transform
-            pixel_size = abs(transform.a)
-            pixel_size_meters = pixel_size * 111320
+        min_zoom = max(0, max_zoom - 8)
 
-            import math
+        return tuple(bounds), min_zoom, max_zoom
 
-            if pixel_size_meters > 0:
-                max_zoom = int(math.log2(156543 / pixel_size_meters))
-                max_zoom = max(0, min(22, max_zoom))
-            else:
-                max_zoom = 18
 
-            min_zoom = max(0, max_zoom - 8)
+def get_geotiff_bounds(filepath: Path) -> tuple[list[float], int, int]:
+    """Get bounds and recommended zoom levels from a GeoTIFF.
 
-            return list(bounds), min_zoom, max_zoom
+    Returns (bounds, min_zoom, max_zoom).
+    """
+    if not TITILER_AVAILABLE:
+        return [-180.0, -85.0, 180.0, 85.0], 0, 22
+
+    try:
+        stat = filepath.stat()
+        bounds, min_zoom, max_zoom = _bounds_cached(
+            str(filepath), stat.st_mtime_ns, stat.st_size
+        )
+        return list(bounds), min_zoom, max_zoom
     except Exception:
         return [-180.0, -85.0, 180.0, 85.0], 0, 22
 
@@ -140,15 +344,12 @@ def create_titiler_router() -> APIRouter:
         if not filepath.exists():
             raise HTTPException(status_code=400, detail=f"File not found: {filepath}")
 
-        if not filepath.suffix.lower() in (".tif", ".tiff", ".geotiff"):
+        if filepath.suffix.lower() not in GEOTIFF_SUFFIXES:
             raise HTTPException(
                 status_code=400,
                 detail="File must be a GeoTIFF (.tif, .tiff, or .geotiff)",
             )
 
-        # Generate unique ID
-        file_id = str(uuid.uuid4())[:8]
-
         # Get bounds and zoom levels
         bounds, min_zoom, max_zoom = get_geotiff_bounds(filepath)
 
@@ -160,7 +361,7 @@ def create_titiler_router() -> APIRouter:
         )
 
         info = GeoTiffInfo(
-            id=file_id,
+            id=uuid.uuid4().hex[:8],
             filename=filepath.name,
             path=str(filepath),
             tile_url_template=tile_url_template,
@@ -169,23 +370,33 @@ def create_titiler_router() -> APIRouter:
             max_zoom=max_zoom,
         )
 
-        # Save to registry
-        registry = load_registry()
-        registry[file_id] = info.model_dump()
-        save_registry(registry)
+        # Save to registry, drawing a new ID on the rare collision
+        while not await asyncio.to_thread(insert_entry, info.model_dump()):
+            info.id = uuid.uuid4().hex[:8]
 
         return info
 
     @router.get("/geotiffs", response_model=GeoTiffListResponse)
     async def list_geotiffs():
         """List all registered GeoTIFFs."""
-        registry = load_registry()
+        entries = await asyncio.to_thread(list_entries)
+        prune_exists_cache()
+        exists = [cached_exists(data["path"]) for data in entries]
+
+        # Stat the rest concurrently, since each check may be a network round trip
+        misses = [i for i, found in enumerate(exists) if found is None]
+        semaphore = asyncio.Semaphore(EXISTS_CHECK_CONCURRENCY)
+
+        async def check(path: str) -> bool:
+            async with semaphore:
+                return await asyncio.to_thread(check_exists, path)
 
-        geotiffs = []
-        for file_id, data in registry.items():
-            filepath = Path(data["path"])
-            if filepath.exists():
-                geotiffs.append(GeoTiffInfo(**data))
+        checked = await asyncio.gather(*(check(entries[i]["path"]) for i in misses))
+        for i, found in zip(misses, checked):
+            exists[i] = found
+        geotiffs = [
+            GeoTiffInfo(**data) for data, found in zip(entries, exists) if found
+        ]
 
         return GeoTiffListResponse(
             geotiffs=geotiffs, titiler_available=TITILER_AVAILABLE
@@ -194,13 +405,10 @@ def create_titiler_router() -> APIRouter:
     @router.delete("/geotiffs/{file_id}")
     async def delete_geotiff(file_id: str):
         """Unregister a GeoTIFF (does not delete the file)."""
-        registry = load_registry()
-
-        if file_id not in registry:
+        path = await asyncio.to_thread(delete_entry, file_id)
+        if path is None:
             raise HTTPException(status_code=404, detail="GeoTIFF not found")
-
-        del registry[file_id]
-        save_registry(registry)
+        _exists_cache.pop(path, None)
 
         return {"deleted": file_id}
 
@@ -210,12 +418,12 @@ def create_titiler_router() -> APIRouter:
         if not TITILER_AVAILABLE:
             raise HTTPException(status_code=503, detail="TiTiler not installed")
 
-        registry = load_registry()
+        entry = await asyncio.to_thread(get_entry, file_id)
 
-        if file_id not in registry:
+        if entry is None:
             raise HTTPException(status_code=404, detail="GeoTIFF not found")
 
-        filepath = Path(registry[file_id]["path"])
+        filepath = Path(entry["path"])
         if not filepath.exists():
             raise HTTPException(status_code=404, detail="File no longer exists")
 
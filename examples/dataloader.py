@@ -1,18 +1,27 @@
 """Simple fine-tuning script for testing COCO format compatibility with ML frameworks."""
 
 import os
-import json
+from collections import OrderedDict, defaultdict
 from pathlib import Path
-from typing import Optional
+from typing import NamedTuple, Optional
 
 # Fix OpenMP library conflict on macOS
 # This is a common issue when multiple libraries link different OpenMP runtimes
 os.environ.setdefault("KMP_DUPLICATE_LIB_OK", "TRUE")
 
+import numpy as np
+
+# orjson parses large COCO files several times faster than the stdlib
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
 try:
     import torch
     from torch.utils.data import Dataset
     from torchvision import transforms
+    from torchvision.io import ImageReadMode, decode_image, read_file
     from PIL import Image
     TORCH_AVAILABLE = True
 except ImportError:
@@ -24,6 +33,10 @@ except ImportError:
 DATA_DIR = Path(__file__).parent.parent / "data"
 COCO_FILE = DATA_DIR / "annotations.json"
 TILES_DIR = DATA_DIR / "tiles"
+PREBUILT_DIR = DATA_DIR / "coco_prebuilt"
+
+# Decoded tiles kept in memory per dataset (and per DataLoader worker)
+TILE_CACHE_SIZE = int(os.environ.get("COCO_TILE_CACHE", 1024))
 
 
 def load_coco_annotations(coco_file: Path = COCO_FILE) -> dict:
@@ -31,8 +44,7 @@ def load_coco_annotations(coco_file: Path = COCO_FILE) -> dict:
     if not coco_file.exists():
         raise FileNotFoundError(f"COCO annotations file not found: {coco_file}")
     
-    with open(coco_file, "r") as f:
-        return json.load(f)
+    return _json_loads(coco_file.read_bytes())
 
 
 def find_tiles_directory() -> Optional[Path]:
@@ -41,7 +53,8 @@ def find_tiles_directory() -> Optional[Path]:
         return None
     
     # Check if tiles are directly in tiles/ or nested under a tile_server_id
-    subdirs = [d for d in TILES_DIR.iterdir() if d.is_dir()]
+    with os.scandir(TILES_DIR) as entries:
+        subdirs = [Path(entry.path) for entry in entries if entry.is_dir()]
     if len(subdirs) == 1:
         # Assume tiles are in the single subdirectory
         return subdirs[0]
@@ -53,7 +66,63 @@ def find_tiles_directory() -> Optional[Path]:
         return subdirs[0]
 
 
+def build_target_arrays(
+    image_ids: list, image_annotations: dict
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Flatten per-image annotations into (starts, boxes, labels) arrays.
+    
+    Boxes and labels are ordered by image, with CSR-style offsets so image i's
+    targets are the contiguous slice starts[i]:starts[i + 1].
+    """
+    ordered_anns = [
+        ann
+        for image_id in image_ids
+        for ann in image_annotations.get(image_id, ())
+    ]
+    counts = [len(image_annotations.get(image_id, ())) for image_id in image_ids]
+    starts = np.zeros(len(image_ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=starts[1:])
+    # COCO bbox format: [x, y, width, height]
+    boxes = np.array(
+        [ann["bbox"] for ann in ordered_anns], dtype=np.float32
+    ).reshape(-1, 4)
+    labels = np.array([ann["category_id"] for ann in ordered_anns], dtype=np.int64)
+    return starts, boxes, labels
+
+
+def prebuild_targets(coco_file: Path = COCO_FILE, out_dir: Path = PREBUILT_DIR):
+    """Save a COCO file's images and targets as NumPy arrays.
+    
+    COCODataset(prebuilt_dir=out_dir) memory-maps these instead of parsing the
+    JSON, so DataLoader workers share one copy through the page cache.
+    """
+    coco_data = load_coco_annotations(coco_file)
+    image_ids = [img["id"] for img in coco_data["images"]]
+    image_annotations = defaultdict(list)
+    for ann in coco_data["annotations"]:
+        image_annotations[ann["image_id"]].append(ann)
+    starts, boxes, labels = build_target_arrays(image_ids, image_annotations)
+    
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / "image_ids.npy", np.array(image_ids, dtype=np.int64))
+    np.save(out_dir / "starts.npy", starts)
+    np.save(out_dir / "boxes.npy", boxes)
+    np.save(out_dir / "labels.npy", labels)
+    (out_dir / "file_names.txt").write_text(
+        "".join(f"{img['file_name']}\n" for img in coco_data["images"])
+    )
+
+
 if TORCH_AVAILABLE:
+    class Sample(NamedTuple):
+        """A COCODataset item."""
+        
+        image: torch.Tensor  # or a PIL Image, depending on transform
+        image_id: int
+        annotations: list  # annotation dicts
+        boxes: torch.Tensor  # [N, 4] (x, y, w, h)
+        labels: torch.Tensor  # [N] (category_ids)
+    
     class COCODataset(Dataset):
         """PyTorch Dataset for COCO format annotations.
         
@@ -65,51 +134,133 @@ if TORCH_AVAILABLE:
             coco_file: Path = COCO_FILE,
             tiles_dir: Optional[Path] = None,
             transform: Optional[transforms.Compose] = None,
+            prebuilt_dir: Optional[Path] = None,
         ):
             """Initialize COCO dataset.
             
             Args:
                 coco_file: Path to COCO annotations JSON file
                 tiles_dir: Path to tiles directory (auto-detected if None)
-                transform: Optional torchvision transforms to apply
+                transform: Optional torchvision transforms to apply to the
+                    PIL image (defaults to a float tensor in [0, 1])
+                prebuilt_dir: Directory written by prebuild_targets(); when
+                    given, targets are memory-mapped from it and coco_file
+                    is not read
             """
             if not TORCH_AVAILABLE:
                 raise ImportError("PyTorch and torchvision are required. Install with: pip install torch torchvision")
             
-            self.coco_data = load_coco_annotations(coco_file)
             self.tiles_dir = tiles_dir or find_tiles_directory()
             
             if self.tiles_dir is None:
                 raise ValueError(f"Tiles directory not found. Expected at: {TILES_DIR}")
             
+            if prebuilt_dir is not None:
+                self._load_prebuilt(prebuilt_dir)
+            else:
+                self._load_coco(coco_file)
+            
+            # Resolve tile paths up front so missing tiles fail early
+            self.image_paths = self._resolve_image_paths(
+                [self.images[image_id]["file_name"] for image_id in self.image_ids]
+            )
+            
+            # Without a transform, tiles are decoded straight to tensors with
+            # torchvision.io, matching what ToTensor() on a PIL image gives
+            self.transform = transform
+            self._tile_cache: OrderedDict = OrderedDict()
+        
+        def _load_coco(self, coco_file: Path):
+            """Index images and targets from a COCO annotations file."""
+            self.coco_data = load_coco_annotations(coco_file)
+            
             # Build image_id -> image mapping
             self.images = {img["id"]: img for img in self.coco_data["images"]}
             
             # Build image_id -> annotations mapping
-            self.image_annotations = {}
+            self.image_annotations = defaultdict(list)
             for ann in self.coco_data["annotations"]:
-                image_id = ann["image_id"]
-                if image_id not in self.image_annotations:
-                    self.image_annotations[image_id] = []
-                self.image_annotations[image_id].append(ann)
+                self.image_annotations[ann["image_id"]].append(ann)
             
             # Create list of image IDs
             self.image_ids = list(self.images.keys())
             
-            # Default transform: convert to tensor and normalize
-            self.transform = transform or transforms.Compose([
-                transforms.ToTensor(),
-            ])
+            self.starts, self.all_boxes, self.all_labels = build_target_arrays(
+                self.image_ids, self.image_annotations
+            )
+        
+        def _load_prebuilt(self, prebuilt_dir: Path):
+            """Memory-map images and targets saved by prebuild_targets()."""
+            self.coco_data = None
+            self.image_annotations = None
+            self.image_ids = np.load(prebuilt_dir / "image_ids.npy").tolist()
+            file_names = (prebuilt_dir / "file_names.txt").read_text().splitlines()
+            self.images = {
+                image_id: {"id": image_id, "file_name": file_name}
+                for image_id, file_name in zip(self.image_ids, file_names)
+            }
+            # Read-only maps share pages between workers
+            self.starts = np.load(prebuilt_dir / "starts.npy", mmap_mode="r")
+            self.all_boxes = np.load(prebuilt_dir / "boxes.npy", mmap_mode="r")
+            self.all_labels = np.load(prebuilt_dir / "labels.npy", mmap_mode="r")
+        
+        def _resolve_image_paths(self, file_names: list[str]) -> list[str]:
+            """Locate each image's tile file under tiles_dir.
+            
+            Whether file names carry a directory prefix (e.g. tiles/) that has
+            to be stripped is decided once from the first image.
+            """
+            strip_prefix = bool(file_names) and (
+                Path(file_names[0]).parent != Path(".")
+                and not (self.tiles_dir / file_names[0]).exists()
+            )
+            if strip_prefix:
+                file_names = [Path(file_name).name for file_name in file_names]
+            
+            # One directory listing covers every tile stored directly in tiles_dir
+            with os.scandir(self.tiles_dir) as entries:
+                available = {entry.name for entry in entries}
+            for file_name in file_names:
+                if Path(file_name).parent == Path("."):
+                    found = file_name in available
+                else:
+                    found = (self.tiles_dir / file_name).exists()
+                if not found:
+                    raise FileNotFoundError(
+                        f"Tile for {file_name} not found in {self.tiles_dir}"
+                    )
+            
+            return [str(self.tiles_dir / file_name) for file_name in file_names]
+        
+        def _load_tile(self, image_path: str):
+            """Decode a tile, keeping recently used tiles in memory.
+            
+            Returns a uint8 CHW tensor without a transform, else a PIL image.
+            Each DataLoader worker keeps its own cache.
+            """
+            tile = self._tile_cache.get(image_path)
+            if tile is not None:
+                self._tile_cache.move_to_end(image_path)
+                return tile
+            if self.transform is None:
+                tile = decode_image(read_file(image_path), mode=ImageReadMode.RGB)
+            else:
+                tile = Image.open(image_path).convert("RGB")
+            if TILE_CACHE_SIZE > 0:
+                self._tile_cache[image_path] = tile
+                if len(self._tile_cache) > TILE_CACHE_SIZE:
+                    self._tile_cache.popitem(last=False)
+            return tile
         
         def __len__(self) -> int:
             """Return number of images in dataset."""
             return len(self.image_ids)
         
-        def __getitem__(self, idx: int) -> dict:
+        def __getitem__(self, idx: int) -> Sample:
             """Get image and annotations for a given index.
             
             Returns:
-                Dictionary with:
+                Sample with:
                     - image: PIL Image or torch.Tensor (depending on transform)
                     - image_id: int
                     - annotations: list of annotation dicts
@@ -117,42 +268,33 @@ if TORCH_AVAILABLE:
                     - labels: torch.Tensor of shape [N] (category_ids)
             """
             image_id = self.image_ids[idx]
-            image_info = self.images[image_id]
             
             # Load image
-            image_path = self.tiles_dir / image_info["file_name"]
-            if not image_path.exists():
-                # Try without tiles/ prefix if file_name includes it
-                image_path = self.tiles_dir / Path(image_info["file_name"]).name
+            image = self._load_tile(self.image_paths[idx])
+            if self.transform is None:
+                image = image.float().div_(255)
+            else:
+                image = self.transform(image)
             
-            image = Image.open(image_path).convert("RGB")
+            start, end = self.starts[idx], self.starts[idx + 1]
+            # Copy the slices so in-place box transforms can't modify the
+            # dataset-wide arrays
+            boxes_tensor = torch.tensor(self.all_boxes[start:end])
+            labels_tensor = torch.tensor(self.all_labels[start:end])
             
             # Get annotations for this image
-            annotations = self.image_annotations.get(image_id, [])
-            
-            # Extract boxes and labels
-            boxes = []
-            labels = []
-            for ann in annotations:
-                # COCO bbox format: [x, y, width, height]
-                boxes.append(ann["bbox"])
-                labels.append(ann["category_id"])
-            
-            # Apply transform
-            if self.transform:
-                image = self.transform(image)
-            
-            # Convert boxes to tensor
-            boxes_tensor = torch.tensor(boxes, dtype=torch.float32) if boxes else torch.zeros((0, 4))
-            labels_tensor = torch.tensor(labels, dtype=torch.int64) if labels else torch.zeros((0,), dtype=torch.int64)
+            if self.image_annotations is not None:
+                annotations = self.image_annotations.get(image_id, [])
+            else:
+                # Prebuilt targets only keep boxes and category ids
+                annotations = [
+                    {"image_id": image_id, "bbox": bbox, "category_id": category_id}
+                    for bbox, category_id in zip(
+                        boxes_tensor.tolist(), labels_tensor.tolist()
+                    )
+                ]
             
-            return {
-                "image": image,
-                "image_id": image_id,
-                "annotations": annotations,
-                "boxes": boxes_tensor,
-                "labels": labels_tensor,
-            }
+            return Sample(image, image_id, annotations, boxes_tensor, labels_tensor)
 else:
     # Dummy class when torch is not available
     class COCODataset:
@@ -176,21 +318,23 @@ def print_dataset_info():
         
         # Count annotations per image
         if coco_data["annotations"]:
-            anns_per_image = {}
-            for ann in coco_data["annotations"]:
-                img_id = ann["image_id"]
-                anns_per_image[img_id] = anns_per_image.get(img_id, 0) + 1
-            
-            avg_anns = sum(anns_per_image.values()) / len(anns_per_image) if anns_per_image else 0
-            print(f"\n  Average annotations per image: {avg_anns:.2f}")
-            print(f"  Images with annotations: {len(anns_per_image)}/{len(coco_data['images'])}")
+            image_ids = np.fromiter(
+                (ann["image_id"] for ann in coco_data["annotations"]),
+                dtype=np.int64,
+                count=len(coco_data["annotations"]),
+            )
+            _, anns_per_image = np.unique(image_ids, return_counts=True)
+            
+            print(f"\n  Average annotations per image: {anns_per_image.mean():.2f}")
+            print(f"  Images with annotations: {anns_per_image.size}/{len(coco_data['images'])}")
         
         # Check tiles directory
         tiles_dir = find_tiles_directory()
         if tiles_dir:
-            tile_files = list(tiles_dir.glob("*.png"))
+            with os.scandir(tiles_dir) as entries:
+                tile_count = sum(1 for entry in entries if entry.name.endswith(".png"))
             print(f"\nTiles directory: {tiles_dir}")
-            print(f"  Found {len(tile_files)} PNG files")
+            print(f"  Found {tile_count} PNG files")
         else:
             print(f"\nTiles directory not found at: {TILES_DIR}")
         
@@ -215,15 +359,15 @@ def test_dataset():
             # Test loading first sample
             sample = dataset[0]
             print(f"\nSample data:")
-            print(f"  Image shape: {sample['image'].shape if isinstance(sample['image'], torch.Tensor) else sample['image'].size}")
-            print(f"  Image ID: {sample['image_id']}")
-            print(f"  Number of annotations: {len(sample['annotations'])}")
-            print(f"  Boxes shape: {sample['boxes'].shape}")
-            print(f"  Labels shape: {sample['labels'].shape}")
+            print(f"  Image shape: {sample.image.shape if isinstance(sample.image, torch.Tensor) else sample.image.size}")
+            print(f"  Image ID: {sample.image_id}")
+            print(f"  Number of annotations: {len(sample.annotations)}")
+            print(f"  Boxes shape: {sample.boxes.shape}")
+            print(f"  Labels shape: {sample.labels.shape}")
             
-            if len(sample['annotations']) > 0:
+            if len(sample.annotations) > 0:
                 print(f"\n  First annotation:")
-                ann = sample['annotations'][0]
+                ann = sample.annotations[0]
                 print(f"    bbox: {ann['bbox']}")
                 print(f"    category_id: {ann['category_id']}")
                 if 'noun_phrase' in ann:
@@ -127,13 +127,13 @@ export async function getLabelsForTile(
     return res.json();
 }
 
-export async function createLabel(label: LabelCreate): Promise<Label> {
-    const res = await fetch(`${API_BASE}/labels`, {
+export async function createLabels(labels: LabelCreate[]): Promise<Label[]> {
+    const res = await fetch(`${API_BASE}/labels/bulk`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(label),
+        body: JSON.stringify(labels),
     });
-    if (!res.ok) throw new Error("Failed to create label");
+    if (!res.ok) throw new Error("Failed to create labels");
     return res.json();
 }
 
@@ -168,6 +168,15 @@ export async function exportGeoJSON(
     return res.json();
 }
 
+export async function exportGeoParquet(): Promise<{
+    path: string;
+    count: number;
+}> {
+    const res = await fetch(`${API_BASE}/export/geoparquet`);
+    if (!res.ok) throw new Error("Failed to export GeoParquet");
+    return res.json();
+}
+
 export async function exportCOCO(tileServerId?: string): Promise<object> {
     const url = tileServerId
         ? `${API_BASE}/export/coco?tile_server_id=${tileServerId}`
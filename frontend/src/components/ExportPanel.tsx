@@ -19,6 +19,7 @@ export function ExportPanel({
     const [dataDirPath, setDataDirPath] = useState<string | null>(null);
     const [exportingGeoJSON, setExportingGeoJSON] = useState(false);
     const [exportingCOCO, setExportingCOCO] = useState(false);
+    const [exportingGeoParquet, setExportingGeoParquet] = useState(false);
     const [useGeoBbox, setUseGeoBbox] = useState(true);
     const [includeSurrounding, setIncludeSurrounding] = useState(false);
 
@@ -54,6 +55,18 @@ export function ExportPanel({
         }
     };
 
+    const handleExportGeoParquet = async () => {
+        setExportingGeoParquet(true);
+        try {
+            await api.exportGeoParquet();
+            setMessage("GeoParquet exported and saved to data directory");
+            setTimeout(() => setExportingGeoParquet(false), 1000);
+        } catch (err) {
+            setMessage("Failed to export GeoParquet");
+            setExportingGeoParquet(false);
+        }
+    };
+
     const handleOpenDataDir = async () => {
         if (!dataDirPath) return;
 
@@ -162,8 +175,8 @@ export function ExportPanel({
             <div className="export-section">
                 <h3>Export Labels</h3>
                 <div className={`message info`}>
-                    Labels are automatically persisted as GeoParquet to{" "}
-                    <code>data/labels.geoparquet</code>
+                    Labels are automatically persisted to{" "}
+                    <code>data/labels.db</code>
                 </div>
                 <div className="export-buttons">
                     <div className="geojson-export-group">
@@ -203,6 +216,12 @@ export function ExportPanel({
                     >
                         Export COCO JSON
                     </button>
+                    <button
+                        onClick={handleExportGeoParquet}
+                        disabled={downloading || exportingGeoParquet}
+                    >
+                        Export GeoParquet
+                    </button>
                 </div>
                 {dataDirPath && (
                     <button
@@ -1,7 +1,13 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import type { Label, LabelCreate } from '../types';
 import * as api from '../api/client';
 
+interface PendingCreate {
+  label: LabelCreate;
+  resolve: (label: Label) => void;
+  reject: (err: unknown) => void;
+}
+
 export function useLabels() {
   const [labels, setLabels] = useState<Label[]>([]);
   const [loading, setLoading] = useState(true);
@@ -23,13 +29,39 @@ export function useLabels() {
     loadLabels().finally(() => setLoading(false));
   }, [loadLabels]);
 
-  // Create a new label
-  const createLabel = useCallback(async (label: LabelCreate) => {
-    const newLabel = await api.createLabel(label);
-    setLabels((prev) => [...prev, newLabel]);
-    return newLabel;
+  // Labels created while a create request is in flight wait here and are
+  // sent together in the next bulk request
+  const pendingCreates = useRef<PendingCreate[]>([]);
+  const createInFlight = useRef(false);
+
+  const flushCreates = useCallback(async () => {
+    if (createInFlight.current) return;
+    createInFlight.current = true;
+    try {
+      while (pendingCreates.current.length > 0) {
+        const batch = pendingCreates.current;
+        pendingCreates.current = [];
+        try {
+          const created = await api.createLabels(batch.map((p) => p.label));
+          setLabels((prev) => [...prev, ...created]);
+          batch.forEach((p, i) => p.resolve(created[i]));
+        } catch (err) {
+          batch.forEach((p) => p.reject(err));
+        }
+      }
+    } finally {
+      createInFlight.current = false;
+    }
   }, []);
 
+  // Create a new label, batched with any others created in quick succession
+  const createLabel = useCallback((label: LabelCreate) => {
+    return new Promise<Label>((resolve, reject) => {
+      pendingCreates.current.push({ label, resolve, reject });
+      void flushCreates();
+    });
+  }, [flushCreates]);
+
   // Update an existing label
   const updateLabel = useCallback(async (id: string, update: Partial<LabelCreate>) => {
     const updated = await api.updateLabel(id, update);